@@ -4,35 +4,411 @@ Args: event with httpMethod, body, headers; context with request_id
 Returns: HTTP response with auth tokens or user data
 """
 
+import csv
+import base64
+import gzip
+import hashlib
+import io
 import json
 import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import partial, wraps
 import jwt
 import bcrypt
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, List
 import psycopg2
+from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 DATABASE_URL = os.environ.get('DATABASE_URL')
 JWT_SECRET = os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+BULK_REGISTER_LIMIT = 200
+
+TIMING_LOG = os.environ.get('TIMING_LOG', '1') == '1'
+TIMING_DEBUG = os.environ.get('TIMING_DEBUG', '0') == '1'
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+
+_request_timing: Optional[Dict[str, Any]] = None
+
+def normalize_sql(sql: Any) -> str:
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    return ' '.join(str(sql).split())
+
+@contextmanager
+def timed(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = _request_timing
+        if timing is not None:
+            timing['phases'][phase] = timing['phases'].get(phase, 0.0) + time.perf_counter() - started
+
+class TimedCursor(RealDictCursor):
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            timing = _request_timing
+            if timing is not None:
+                timing['queries'].append((query, time.perf_counter() - started))
+
+class RawJSON:
+    # JSON text that is already encoded (e.g. by json_agg in Postgres) and is embedded as-is
+    __slots__ = ('text',)
+    
+    def __init__(self, text: str):
+        self.text = text
+
+def json_default(value: Any) -> Any:
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, RawJSON) and orjson is not None:
+        return orjson.Fragment(value.text)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def to_json(data: Any) -> str:
+    with timed('serialize'):
+        if orjson is not None:
+            return orjson.dumps(data, default=json_default).decode('utf-8')
+        
+        fragments: List[str] = []
+        marker = uuid.uuid4().hex
+        
+        def default(value: Any) -> Any:
+            if isinstance(value, RawJSON):
+                fragments.append(value.text)
+                return f'{marker}:{len(fragments) - 1}'
+            return json_default(value)
+        
+        text = json.dumps(data, default=default)
+        for index, fragment in enumerate(fragments):
+            text = text.replace(f'"{marker}:{index}"', fragment, 1)
+        return text
+
+def request_action(event: Dict[str, Any]) -> Optional[str]:
+    params = event.get('queryStringParameters') or {}
+    if params.get('action'):
+        return params['action']
+    body = event.get('body') or ''
+    if body.startswith('{') and len(body) <= 65536:
+        try:
+            return json.loads(body).get('action')
+        except ValueError:
+            return None
+    return None
+
+def timing_summary(timing: Dict[str, Any], total: float) -> Dict[str, Any]:
+    queries: Dict[str, Dict[str, Any]] = {}
+    for sql, duration in timing['queries']:
+        entry = queries.setdefault(normalize_sql(sql), {'calls': 0, 'ms': 0.0})
+        entry['calls'] += 1
+        entry['ms'] += duration * 1000
+    return {
+        'total_ms': round(total * 1000, 2),
+        'phases': {name: round(duration * 1000, 2) for name, duration in timing['phases'].items()},
+        'db_ms': round(sum(duration for _, duration in timing['queries']) * 1000, 2),
+        'query_count': len(timing['queries']),
+        'queries': [{'sql': sql, 'calls': entry['calls'], 'ms': round(entry['ms'], 2)} for sql, entry in queries.items()]
+    }
+
+def server_timing_header(summary: Dict[str, Any]) -> str:
+    metrics = [f'{name};dur={duration}' for name, duration in summary['phases'].items()]
+    metrics.append(f'db;dur={summary["db_ms"]};desc="{summary["query_count"]} queries"')
+    metrics.append(f'total;dur={summary["total_ms"]}')
+    return ', '.join(metrics)
+
+def request_header(event: Dict[str, Any], name: str) -> str:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value or ''
+    return ''
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    encodings = []
+    for item in request_header(event, 'Accept-Encoding').split(','):
+        name, _, params = item.strip().partition(';')
+        if name and params.strip().replace(' ', '') not in ('q=0', 'q=0.0'):
+            encodings.append(name.strip().lower())
+    return encodings
+
+def prepare_response(event: Dict[str, Any], response: Dict[str, Any],
+                     debug_fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    body = response.get('body') or ''
+    if not body or response.get('isBase64Encoded'):
+        return response
+    headers = dict(response.get('headers') or {})
+    
+    if event.get('httpMethod') == 'GET' and response.get('statusCode') == 200:
+        # Weak validator: the same entity may be sent gzip, brotli or identity encoded
+        etag = 'W/"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+        headers['ETag'] = etag
+        headers.setdefault('Cache-Control', 'private, no-cache')
+        headers['Access-Control-Expose-Headers'] = 'ETag, Server-Timing'
+        if_none_match = request_header(event, 'If-None-Match')
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        if if_none_match.strip() == '*' or etag in candidates or etag[2:] in candidates:
+            return {**response, 'statusCode': 304, 'headers': headers, 'body': '', 'isBase64Encoded': False}
+    
+    # Debug fields change on every request, so they are added after the ETag is taken
+    if debug_fields and body.startswith('{'):
+        body = to_json({**json.loads(body), **debug_fields})
+    
+    raw = body.encode('utf-8')
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return {**response, 'headers': headers, 'body': body}
+    
+    encodings = accepted_encodings(event)
+    if 'br' in encodings and brotli is not None:
+        compressed, encoding = brotli.compress(raw, quality=BROTLI_QUALITY), 'br'
+    elif 'gzip' in encodings:
+        compressed, encoding = gzip.compress(raw, compresslevel=GZIP_LEVEL), 'gzip'
+    else:
+        return {**response, 'headers': headers, 'body': body}
+    
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def instrumented(func: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    @wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        global _request_timing
+        timing: Dict[str, Any] = {'phases': {}, 'queries': []}
+        _request_timing = timing
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+            debug_fields = {'_timing': timing_summary(timing, time.perf_counter() - started)} if TIMING_DEBUG else None
+            with timed('compress'):
+                response = prepare_response(event, response, debug_fields)
+        finally:
+            _request_timing = None
+        
+        summary = timing_summary(timing, time.perf_counter() - started)
+        response['headers'] = {
+            **(response.get('headers') or {}),
+            'Server-Timing': server_timing_header(summary),
+            'Timing-Allow-Origin': '*'
+        }
+        
+        if TIMING_LOG:
+            log_line = {
+                'type': 'timing',
+                'function': getattr(context, 'function_name', None),
+                'request_id': getattr(context, 'request_id', None),
+                'method': event.get('httpMethod'),
+                'action': request_action(event),
+                'status': response.get('statusCode'),
+                **summary
+            }
+            if response.get('statusCode', 200) >= 500:
+                log_line['error'] = response.get('body')
+            print(json.dumps(log_line, ensure_ascii=False))
+        
+        return response
+    return wrapper
+
+DB_SCHEMA = os.environ.get('DB_SCHEMA', 't_p91447108_ai_improvement_websi')
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_INTERVAL = float(os.environ.get('DB_POOL_PING_INTERVAL', '30'))
+
+_db_pool: Optional[pool.ThreadedConnectionPool] = None
+_db_last_used: Dict[int, float] = {}
+
+def get_db_pool() -> pool.ThreadedConnectionPool:
+    global _db_pool
+    if _db_pool is None or _db_pool.closed:
+        _db_pool = pool.ThreadedConnectionPool(
+            DB_POOL_MIN,
+            DB_POOL_MAX,
+            DATABASE_URL,
+            cursor_factory=TimedCursor,
+            options=f'-c search_path={DB_SCHEMA},public'
+        )
+    return _db_pool
 
+def is_connection_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    last_used = _db_last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as ping:
+            ping.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@timed('connect')
 def get_db_connection():
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+    db_pool = get_db_pool()
+    for _ in range(DB_POOL_MAX + 1):
+        conn = db_pool.getconn()
+        if is_connection_healthy(conn):
+            return conn
+        _db_last_used.pop(id(conn), None)
+        db_pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Не удалось получить соединение с базой данных')
+
+def release_db_connection(conn) -> None:
+    broken = conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+    if not broken and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    if broken:
+        _db_last_used.pop(id(conn), None)
+    else:
+        _db_last_used[id(conn)] = time.monotonic()
+    get_db_pool().putconn(conn, close=broken)
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', str(os.cpu_count() or 2)))
+BCRYPT_QUEUE_LIMIT = int(os.environ.get('BCRYPT_QUEUE_LIMIT', '32'))
+BCRYPT_TIMEOUT = float(os.environ.get('BCRYPT_TIMEOUT', '10'))
+
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+_bcrypt_slots = threading.BoundedSemaphore(BCRYPT_WORKERS + BCRYPT_QUEUE_LIMIT)
+
+class HashingOverloaded(Exception):
+    pass
+
+def submit_bcrypt(task: Callable[[], Any]) -> Future:
+    if not _bcrypt_slots.acquire(blocking=False):
+        raise HashingOverloaded()
+    try:
+        future = _bcrypt_executor.submit(task)
+    except BaseException:
+        _bcrypt_slots.release()
+        raise
+    future.add_done_callback(lambda _: _bcrypt_slots.release())
+    return future
+
+@timed('bcrypt')
+def run_bcrypt(task: Callable[[], Any]) -> Any:
+    return submit_bcrypt(task).result(timeout=BCRYPT_TIMEOUT)
+
+def _hashpw(password: str, salt: bytes) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
-def generate_token(user_id: int, email: str) -> str:
+def hash_password(password: str) -> str:
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return run_bcrypt(lambda: _hashpw(password, salt))
+
+@timed('bcrypt')
+def hash_passwords(passwords: List[str]) -> List[str]:
+    hashes = []
+    for start in range(0, len(passwords), BCRYPT_WORKERS):
+        futures = [
+            submit_bcrypt(partial(_hashpw, password, bcrypt.gensalt(rounds=BCRYPT_ROUNDS)))
+            for password in passwords[start:start + BCRYPT_WORKERS]
+        ]
+        hashes.extend(future.result(timeout=BCRYPT_TIMEOUT) for future in futures)
+    return hashes
+
+def check_password(password: str, password_hash: str) -> bool:
+    return run_bcrypt(lambda: bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')))
+
+def password_needs_rehash(password_hash: str) -> bool:
+    try:
+        return int(password_hash.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+def generate_token(user: Dict[str, Any]) -> str:
     payload = {
-        'user_id': user_id,
-        'email': email,
+        'user_id': user['id'],
+        'email': user['email'],
+        'role': user['role'],
+        'class_name': user['class_name'],
+        'tv': user['token_version'],
         'exp': datetime.utcnow() + timedelta(days=7)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
 
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '1024'))
+
+_token_cache: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+
+@timed('auth')
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    payload = _token_cache.get(token_hash)
+    if payload is not None and payload.get('exp', 0) > time.time():
+        _token_cache.move_to_end(token_hash)
+        return payload
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-    except:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        _token_cache.pop(token_hash, None)
         return None
+    _token_cache[token_hash] = payload
+    if len(_token_cache) > AUTH_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return payload
+
+def parse_roster(body_data: Dict[str, Any]) -> List[Dict[str, str]]:
+    default_class = str(body_data.get('class_name') or '').strip()
+    students = []
+    for student in body_data.get('students') or []:
+        students.append({
+            'email': str(student.get('email') or '').strip().lower(),
+            'full_name': str(student.get('full_name') or '').strip(),
+            'class_name': str(student.get('class_name') or default_class).strip(),
+            'password': str(student.get('password') or '')
+        })
+    
+    csv_text = body_data.get('csv')
+    if csv_text:
+        rows = [row for row in csv.reader(io.StringIO(csv_text)) if row and row[0].strip()]
+        if rows and rows[0][0].strip().lower() == 'email':
+            rows = rows[1:]
+        for row in rows:
+            row = row + [''] * (4 - len(row))
+            students.append({
+                'email': row[0].strip().lower(),
+                'full_name': row[1].strip(),
+                'class_name': row[2].strip() or default_class,
+                'password': row[3]
+            })
+    return students
 
+@instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -42,7 +418,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -53,6 +429,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -72,38 +449,44 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': headers,
-                        'body': json.dumps({'error': 'Все поля обязательны для заполнения'})
+                        'body': to_json({'error': 'Все поля обязательны для заполнения'})
                     }
                 
-                cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-                if cursor.fetchone():
-                    return {
-                        'statusCode': 409,
-                        'headers': headers,
-                        'body': json.dumps({'error': 'Пользователь с таким email уже существует'})
-                    }
-                
-                password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                # Hashing before the duplicate check keeps response time independent of whether the email is taken
+                password_hash = hash_password(password)
                 
                 cursor.execute(
-                    "INSERT INTO users (email, password_hash, full_name, class_name, role) VALUES (%s, %s, %s, %s, %s) RETURNING id, email, full_name, role, created_at",
+                    """
+                    WITH inserted AS (
+                        INSERT INTO users (email, password_hash, full_name, class_name, role)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (email) DO NOTHING
+                        RETURNING id, email, full_name, class_name, role, token_version, created_at
+                    ),
+                    progress AS (
+                        INSERT INTO user_progress (user_id)
+                        SELECT id FROM inserted
+                    )
+                    SELECT * FROM inserted
+                    """,
                     (email, password_hash, full_name, class_name, role)
                 )
                 user = cursor.fetchone()
-                
-                cursor.execute(
-                    "INSERT INTO user_progress (user_id) VALUES (%s)",
-                    (user['id'],)
-                )
-                
                 conn.commit()
                 
-                token = generate_token(user['id'], user['email'])
+                if not user:
+                    return {
+                        'statusCode': 409,
+                        'headers': headers,
+                        'body': to_json({'error': 'Пользователь с таким email уже существует'})
+                    }
+                
+                token = generate_token(user)
                 
                 return {
                     'statusCode': 201,
                     'headers': headers,
-                    'body': json.dumps({
+                    'body': to_json({
                         'token': token,
                         'user': {
                             'id': user['id'],
@@ -115,6 +498,194 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     })
                 }
             
+            elif action == 'register_batch':
+                auth_token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
+                payload = verify_token(auth_token) if auth_token else None
+                
+                if payload:
+                    cursor.execute("SELECT role, token_version FROM users WHERE id = %s", (payload.get('user_id'),))
+                    teacher = cursor.fetchone()
+                else:
+                    teacher = None
+                
+                if not teacher or teacher['role'] != 'teacher' or payload.get('tv', 0) != teacher['token_version']:
+                    return {
+                        'statusCode': 403,
+                        'headers': headers,
+                        'body': to_json({'error': 'Доступ запрещен. Только для преподавателей'})
+                    }
+                
+                students = parse_roster(body_data)
+                
+                if not students:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': to_json({'error': 'Передайте список students или csv'})
+                    }
+                
+                if len(students) > BULK_REGISTER_LIMIT:
+                    return {
+                        'statusCode': 413,
+                        'headers': headers,
+                        'body': to_json({'error': f'Не более {BULK_REGISTER_LIMIT} студентов за один запрос'})
+                    }
+                
+                results = []
+                candidates = {}
+                for student in students:
+                    if '@' not in student['email'] or not student['full_name'] or not student['password']:
+                        results.append({'email': student['email'], 'status': 'invalid'})
+                    elif student['email'] in candidates:
+                        results.append({'email': student['email'], 'status': 'duplicate'})
+                    else:
+                        candidates[student['email']] = student
+                        results.append({'email': student['email'], 'status': None})
+                
+                # Cheap lookup so bcrypt only runs for new accounts; concurrent sign-ups are still caught by ON CONFLICT
+                existing = {}
+                if candidates:
+                    cursor.execute("SELECT id, email, role FROM users WHERE email = ANY(%s)", (list(candidates.keys()),))
+                    existing = {row['email']: row for row in cursor.fetchall()}
+                
+                new_students = [s for email, s in candidates.items() if email not in existing]
+                existing_student_ids = [row['id'] for row in existing.values() if row['role'] == 'student']
+                created = {}
+                enrolled = {}
+                if new_students or existing_student_ids:
+                    password_hashes = hash_passwords([s['password'] for s in new_students]) if new_students else []
+                    # Students who already have an account are linked to the teacher alongside the new ones
+                    cursor.execute(
+                        """
+                        WITH inserted AS (
+                            INSERT INTO users (email, password_hash, full_name, class_name, role)
+                            SELECT email, password_hash, full_name, class_name, 'student'
+                            FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[])
+                                AS r(email, password_hash, full_name, class_name)
+                            ON CONFLICT (email) DO NOTHING
+                            RETURNING id, email
+                        ),
+                        progress AS (
+                            INSERT INTO user_progress (user_id)
+                            SELECT id FROM inserted
+                        ),
+                        existing AS (
+                            SELECT id, email FROM users
+                            WHERE id = ANY(%s::int[]) AND role = 'student'
+                        ),
+                        linked AS (
+                            INSERT INTO teacher_students (teacher_id, student_id)
+                            SELECT %s, id FROM inserted
+                            UNION ALL
+                            SELECT %s, id FROM existing
+                            ON CONFLICT (teacher_id, student_id) DO NOTHING
+                        )
+                        SELECT id, email, 'created' AS status FROM inserted
+                        UNION ALL
+                        SELECT id, email, 'enrolled' FROM existing
+                        """,
+                        (
+                            [s['email'] for s in new_students],
+                            password_hashes,
+                            [s['full_name'] for s in new_students],
+                            [s['class_name'] for s in new_students],
+                            existing_student_ids,
+                            payload.get('user_id'),
+                            payload.get('user_id')
+                        )
+                    )
+                    for row in cursor.fetchall():
+                        (created if row['status'] == 'created' else enrolled)[row['email']] = row['id']
+                    conn.commit()
+                
+                for result in results:
+                    if result['status'] is None:
+                        if result['email'] in created:
+                            result['status'] = 'created'
+                            result['user_id'] = created[result['email']]
+                        elif result['email'] in enrolled:
+                            result['status'] = 'enrolled'
+                            result['user_id'] = enrolled[result['email']]
+                        else:
+                            # Non-student account, or an address registered concurrently with this import
+                            result['status'] = 'conflict'
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': to_json({
+                        'success': True,
+                        'created': len(created),
+                        'enrolled': len(enrolled),
+                        'results': results
+                    })
+                }
+            
+            elif action == 'change_password':
+                auth_token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
+                payload = verify_token(auth_token) if auth_token else None
+                current_password = body_data.get('current_password', '')
+                new_password = body_data.get('new_password', '')
+                
+                if not payload:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': to_json({'error': 'Недействительный токен'})
+                    }
+                
+                if not current_password or not new_password:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': to_json({'error': 'Текущий и новый пароль обязательны'})
+                    }
+                
+                cursor.execute(
+                    "SELECT id, password_hash, token_version FROM users WHERE id = %s",
+                    (payload.get('user_id'),)
+                )
+                user = cursor.fetchone()
+                
+                if not user or payload.get('tv', 0) != user['token_version']:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': to_json({'error': 'Недействительный токен'})
+                    }
+                
+                if not check_password(current_password, user['password_hash']):
+                    return {
+                        'statusCode': 403,
+                        'headers': headers,
+                        'body': to_json({'error': 'Неверный текущий пароль'})
+                    }
+                
+                # Changing the password revokes every earlier token; the rehash on login deliberately does not
+                cursor.execute(
+                    """
+                    UPDATE users SET password_hash = %s, token_version = token_version + 1
+                    WHERE id = %s AND token_version = %s
+                    RETURNING id, email, role, class_name, token_version
+                    """,
+                    (hash_password(new_password), user['id'], user['token_version'])
+                )
+                updated = cursor.fetchone()
+                conn.commit()
+                
+                if not updated:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': to_json({'error': 'Недействительный токен'})
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': to_json({'success': True, 'token': generate_token(updated)})
+                }
+            
             elif action == 'login':
                 email = body_data.get('email', '').strip().lower()
                 password = body_data.get('password', '')
@@ -123,28 +694,35 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': headers,
-                        'body': json.dumps({'error': 'Email и пароль обязательны'})
+                        'body': to_json({'error': 'Email и пароль обязательны'})
                     }
                 
                 cursor.execute(
-                    "SELECT id, email, password_hash, full_name, role, created_at FROM users WHERE email = %s",
+                    "SELECT id, email, password_hash, full_name, class_name, role, token_version, created_at FROM users WHERE email = %s",
                     (email,)
                 )
                 user = cursor.fetchone()
                 
-                if not user or not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+                if not user or not check_password(password, user['password_hash']):
                     return {
                         'statusCode': 401,
                         'headers': headers,
-                        'body': json.dumps({'error': 'Неверный email или пароль'})
+                        'body': to_json({'error': 'Неверный email или пароль'})
                     }
                 
-                token = generate_token(user['id'], user['email'])
+                if password_needs_rehash(user['password_hash']):
+                    cursor.execute(
+                        "UPDATE users SET password_hash = %s WHERE id = %s",
+                        (hash_password(password), user['id'])
+                    )
+                    conn.commit()
+                
+                token = generate_token(user)
                 
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({
+                    'body': to_json({
                         'token': token,
                         'user': {
                             'id': user['id'],
@@ -163,7 +741,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 401,
                     'headers': headers,
-                    'body': json.dumps({'error': 'Токен авторизации не предоставлен'})
+                    'body': to_json({'error': 'Токен авторизации не предоставлен'})
                 }
             
             payload = verify_token(auth_token)
@@ -171,15 +749,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 401,
                     'headers': headers,
-                    'body': json.dumps({'error': 'Недействительный токен'})
+                    'body': to_json({'error': 'Недействительный токен'})
                 }
             
             user_id = payload.get('user_id')
             
             cursor.execute(
                 """
-                SELECT u.id, u.email, u.full_name, u.class_name, u.role, u.created_at, 
-                       up.test_results, up.completed_topics, up.last_activity
+                SELECT u.id, u.email, u.full_name, u.class_name, u.role, u.token_version, u.created_at, 
+                       up.tests_completed, up.score_sum, up.completed_topics, up.last_activity
                 FROM users u
                 LEFT JOIN user_progress up ON u.id = up.user_id
                 WHERE u.id = %s
@@ -192,13 +770,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 404,
                     'headers': headers,
-                    'body': json.dumps({'error': 'Пользователь не найден'})
+                    'body': to_json({'error': 'Пользователь не найден'})
+                }
+            
+            if payload.get('tv', 0) != user['token_version']:
+                return {
+                    'statusCode': 401,
+                    'headers': headers,
+                    'body': to_json({'error': 'Недействительный токен'})
                 }
             
+            tests_completed = user['tests_completed'] or 0
+            average_score = user['score_sum'] / tests_completed if tests_completed > 0 else 0
+            
             return {
                 'statusCode': 200,
                 'headers': headers,
-                'body': json.dumps({
+                'body': to_json({
                     'user': {
                         'id': user['id'],
                         'email': user['email'],
@@ -206,25 +794,34 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'class_name': user['class_name'],
                         'role': user['role'],
                         'created_at': user['created_at'].isoformat(),
-                        'test_results': user['test_results'] or [],
+                        'tests_completed': tests_completed,
+                        'average_score': round(average_score, 1),
                         'completed_topics': user['completed_topics'] or [],
                         'last_activity': user['last_activity'].isoformat() if user['last_activity'] else None
                     }
                 })
             }
         
-        cursor.close()
-        conn.close()
-        
         return {
             'statusCode': 405,
             'headers': headers,
-            'body': json.dumps({'error': 'Метод не поддерживается'})
+            'body': to_json({'error': 'Метод не поддерживается'})
+        }
+        
+    except (HashingOverloaded, FutureTimeoutError):
+        return {
+            'statusCode': 503,
+            'headers': {**headers, 'Retry-After': '1'},
+            'body': to_json({'error': 'Сервер перегружен, попробуйте войти через несколько секунд'})
         }
         
     except Exception as e:
         return {
             'statusCode': 500,
             'headers': headers,
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'})
-        }
\ No newline at end of file
+            'body': to_json({'error': f'Ошибка сервера: {str(e)}'})
+        }
+    
+    finally:
+        if conn is not None:
+            release_db_connection(conn)
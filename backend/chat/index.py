@@ -5,29 +5,488 @@ Args: event with httpMethod, body, queryStringParameters, headers
 Returns: HTTP response dict
 """
 
+import base64
+import gzip
+import hashlib
 import json
 import os
+import select
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import wraps
 import jwt
-from typing import Dict, Any, Optional
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple, Callable, List
 import psycopg2
+from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 DATABASE_URL = os.environ.get('DATABASE_URL')
 JWT_SECRET = os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+CHAT_PAGE_SIZE = int(os.environ.get('CHAT_PAGE_SIZE', '50'))
+CHAT_PAGE_SIZE_MAX = 200
+CHAT_WAIT_MAX = float(os.environ.get('CHAT_WAIT_MAX', '25'))
+CHAT_PREVIEW_LENGTH = 200
+CHAT_INBOX_SIZE = 100
+JSON_PASSTHROUGH = os.environ.get('JSON_PASSTHROUGH', '0') == '1'
+
+TIMING_LOG = os.environ.get('TIMING_LOG', '1') == '1'
+TIMING_DEBUG = os.environ.get('TIMING_DEBUG', '0') == '1'
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+
+_request_timing: Optional[Dict[str, Any]] = None
+
+def normalize_sql(sql: Any) -> str:
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    return ' '.join(str(sql).split())
+
+@contextmanager
+def timed(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = _request_timing
+        if timing is not None:
+            timing['phases'][phase] = timing['phases'].get(phase, 0.0) + time.perf_counter() - started
+
+class TimedCursor(RealDictCursor):
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            timing = _request_timing
+            if timing is not None:
+                timing['queries'].append((query, time.perf_counter() - started))
+
+class RawJSON:
+    # JSON text that is already encoded (e.g. by json_agg in Postgres) and is embedded as-is
+    __slots__ = ('text',)
+    
+    def __init__(self, text: str):
+        self.text = text
+
+def json_default(value: Any) -> Any:
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, RawJSON) and orjson is not None:
+        return orjson.Fragment(value.text)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def to_json(data: Any) -> str:
+    with timed('serialize'):
+        if orjson is not None:
+            return orjson.dumps(data, default=json_default).decode('utf-8')
+        
+        fragments: List[str] = []
+        marker = uuid.uuid4().hex
+        
+        def default(value: Any) -> Any:
+            if isinstance(value, RawJSON):
+                fragments.append(value.text)
+                return f'{marker}:{len(fragments) - 1}'
+            return json_default(value)
+        
+        text = json.dumps(data, default=default)
+        for index, fragment in enumerate(fragments):
+            text = text.replace(f'"{marker}:{index}"', fragment, 1)
+        return text
 
+def request_action(event: Dict[str, Any]) -> Optional[str]:
+    params = event.get('queryStringParameters') or {}
+    if params.get('action'):
+        return params['action']
+    body = event.get('body') or ''
+    if body.startswith('{') and len(body) <= 65536:
+        try:
+            return json.loads(body).get('action')
+        except ValueError:
+            return None
+    return None
+
+def timing_summary(timing: Dict[str, Any], total: float) -> Dict[str, Any]:
+    queries: Dict[str, Dict[str, Any]] = {}
+    for sql, duration in timing['queries']:
+        entry = queries.setdefault(normalize_sql(sql), {'calls': 0, 'ms': 0.0})
+        entry['calls'] += 1
+        entry['ms'] += duration * 1000
+    return {
+        'total_ms': round(total * 1000, 2),
+        'phases': {name: round(duration * 1000, 2) for name, duration in timing['phases'].items()},
+        'db_ms': round(sum(duration for _, duration in timing['queries']) * 1000, 2),
+        'query_count': len(timing['queries']),
+        'queries': [{'sql': sql, 'calls': entry['calls'], 'ms': round(entry['ms'], 2)} for sql, entry in queries.items()]
+    }
+
+def server_timing_header(summary: Dict[str, Any]) -> str:
+    metrics = [f'{name};dur={duration}' for name, duration in summary['phases'].items()]
+    metrics.append(f'db;dur={summary["db_ms"]};desc="{summary["query_count"]} queries"')
+    metrics.append(f'total;dur={summary["total_ms"]}')
+    return ', '.join(metrics)
+
+def request_header(event: Dict[str, Any], name: str) -> str:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value or ''
+    return ''
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    encodings = []
+    for item in request_header(event, 'Accept-Encoding').split(','):
+        name, _, params = item.strip().partition(';')
+        if name and params.strip().replace(' ', '') not in ('q=0', 'q=0.0'):
+            encodings.append(name.strip().lower())
+    return encodings
+
+def prepare_response(event: Dict[str, Any], response: Dict[str, Any],
+                     debug_fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    body = response.get('body') or ''
+    if not body or response.get('isBase64Encoded'):
+        return response
+    headers = dict(response.get('headers') or {})
+    
+    if event.get('httpMethod') == 'GET' and response.get('statusCode') == 200:
+        # Weak validator: the same entity may be sent gzip, brotli or identity encoded
+        etag = 'W/"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+        headers['ETag'] = etag
+        headers.setdefault('Cache-Control', 'private, no-cache')
+        headers['Access-Control-Expose-Headers'] = 'ETag, Server-Timing'
+        if_none_match = request_header(event, 'If-None-Match')
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        if if_none_match.strip() == '*' or etag in candidates or etag[2:] in candidates:
+            return {**response, 'statusCode': 304, 'headers': headers, 'body': '', 'isBase64Encoded': False}
+    
+    # Debug fields change on every request, so they are added after the ETag is taken
+    if debug_fields and body.startswith('{'):
+        body = to_json({**json.loads(body), **debug_fields})
+    
+    raw = body.encode('utf-8')
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return {**response, 'headers': headers, 'body': body}
+    
+    encodings = accepted_encodings(event)
+    if 'br' in encodings and brotli is not None:
+        compressed, encoding = brotli.compress(raw, quality=BROTLI_QUALITY), 'br'
+    elif 'gzip' in encodings:
+        compressed, encoding = gzip.compress(raw, compresslevel=GZIP_LEVEL), 'gzip'
+    else:
+        return {**response, 'headers': headers, 'body': body}
+    
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def instrumented(func: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    @wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        global _request_timing
+        timing: Dict[str, Any] = {'phases': {}, 'queries': []}
+        _request_timing = timing
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+            debug_fields = {'_timing': timing_summary(timing, time.perf_counter() - started)} if TIMING_DEBUG else None
+            with timed('compress'):
+                response = prepare_response(event, response, debug_fields)
+        finally:
+            _request_timing = None
+        
+        summary = timing_summary(timing, time.perf_counter() - started)
+        response['headers'] = {
+            **(response.get('headers') or {}),
+            'Server-Timing': server_timing_header(summary),
+            'Timing-Allow-Origin': '*'
+        }
+        
+        if TIMING_LOG:
+            log_line = {
+                'type': 'timing',
+                'function': getattr(context, 'function_name', None),
+                'request_id': getattr(context, 'request_id', None),
+                'method': event.get('httpMethod'),
+                'action': request_action(event),
+                'status': response.get('statusCode'),
+                **summary
+            }
+            if response.get('statusCode', 200) >= 500:
+                log_line['error'] = response.get('body')
+            print(json.dumps(log_line, ensure_ascii=False))
+        
+        return response
+    return wrapper
+
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '1024'))
+# A bumped token_version reaches a warm instance within this many seconds; until then it still accepts older tokens
+TOKEN_VERSION_TTL = float(os.environ.get('TOKEN_VERSION_TTL', '60'))
+
+_token_cache: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+_token_versions: Dict[int, Tuple[int, str, float]] = {}
+
+@timed('auth')
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    payload = _token_cache.get(token_hash)
+    if payload is not None and payload.get('exp', 0) > time.time():
+        _token_cache.move_to_end(token_hash)
+        return payload
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-    except:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        _token_cache.pop(token_hash, None)
         return None
+    _token_cache[token_hash] = payload
+    if len(_token_cache) > AUTH_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return payload
+
+@timed('auth')
+def resolve_user(cursor, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    user_id = payload.get('user_id')
+    cached = _token_versions.get(user_id)
+    # A token newer than the cached version was issued after a bump this process has not seen yet
+    if ('role' not in payload or cached is None or payload.get('tv', 0) > cached[0]
+            or time.monotonic() - cached[2] >= TOKEN_VERSION_TTL):
+        cursor.execute("SELECT role, token_version FROM users WHERE id = %s", (user_id,))
+        row = cursor.fetchone()
+        if not row:
+            _token_versions.pop(user_id, None)
+            return None
+        cached = (row['token_version'], row['role'], time.monotonic())
+        _token_versions[user_id] = cached
+    if payload.get('tv', 0) != cached[0]:
+        return None
+    return {
+        'user_id': user_id,
+        'role': payload.get('role') or cached[1],
+        'class_name': payload.get('class_name')
+    }
+
+DB_SCHEMA = os.environ.get('DB_SCHEMA', 't_p91447108_ai_improvement_websi')
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_INTERVAL = float(os.environ.get('DB_POOL_PING_INTERVAL', '30'))
+
+_db_pool: Optional[pool.ThreadedConnectionPool] = None
+_db_last_used: Dict[int, float] = {}
+
+def get_db_pool() -> pool.ThreadedConnectionPool:
+    global _db_pool
+    if _db_pool is None or _db_pool.closed:
+        _db_pool = pool.ThreadedConnectionPool(
+            DB_POOL_MIN,
+            DB_POOL_MAX,
+            DATABASE_URL,
+            cursor_factory=TimedCursor,
+            options=f'-c search_path={DB_SCHEMA},public'
+        )
+    return _db_pool
+
+def is_connection_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    last_used = _db_last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as ping:
+            ping.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
+@timed('connect')
 def get_db_connection():
-    return psycopg2.connect(
-        DATABASE_URL,
-        cursor_factory=RealDictCursor,
-        options='-c search_path=t_p91447108_ai_improvement_websi,public'
-    )
+    db_pool = get_db_pool()
+    for _ in range(DB_POOL_MAX + 1):
+        conn = db_pool.getconn()
+        if is_connection_healthy(conn):
+            return conn
+        _db_last_used.pop(id(conn), None)
+        db_pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Не удалось получить соединение с базой данных')
+
+def release_db_connection(conn) -> None:
+    broken = conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+    if not broken and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    if broken:
+        _db_last_used.pop(id(conn), None)
+    else:
+        _db_last_used[id(conn)] = time.monotonic()
+    get_db_pool().putconn(conn, close=broken)
+
+def chat_channel(user_id: Any) -> str:
+    return f'chat_user_{int(user_id)}'
+
+def listen_for_messages(conn, user_id: Any) -> None:
+    with conn.cursor() as listen_cursor:
+        listen_cursor.execute(f'LISTEN {chat_channel(user_id)}')
+    conn.commit()
+
+def stop_listening(conn) -> None:
+    if conn.closed:
+        return
+    conn.rollback()
+    with conn.cursor() as listen_cursor:
+        listen_cursor.execute('UNLISTEN *')
+    conn.commit()
+    del conn.notifies[:]
+
+@timed('wait')
+def wait_for_message(conn, sender_id: Any, timeout: float) -> bool:
+    # Notifications are only delivered between transactions
+    conn.commit()
+    deadline = time.monotonic() + timeout
+    while True:
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                payload = json.loads(notify.payload)
+            except ValueError:
+                continue
+            if str(payload.get('sender_id')) == str(sender_id):
+                return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if select.select([conn], [], [], remaining) != ([], [], []):
+            conn.poll()
+
+def conversation_key(user_id: Any, other_user_id: Any) -> int:
+    low, high = sorted((int(user_id), int(other_user_id)))
+    return (low << 32) | high
+
+def build_history_query(key: int, since_id: Optional[int], since_ts: Optional[datetime],
+                        before_id: Optional[int], limit: int) -> Tuple[str, list, str]:
+    conversation_filter = """
+        FROM chat_messages cm
+        JOIN users u ON u.id = cm.sender_id
+        WHERE cm.conversation_key = %s
+    """
+    query_params: list = [key]
+    
+    if since_id is not None or since_ts is not None:
+        if since_id is not None:
+            conversation_filter += " AND cm.id > %s"
+            query_params.append(since_id)
+        else:
+            conversation_filter += " AND cm.created_at > %s"
+            query_params.append(since_ts)
+        order = 'ASC'
+    else:
+        if before_id is not None:
+            conversation_filter += " AND cm.id < %s"
+            query_params.append(before_id)
+        order = 'DESC'
+    
+    history_query = f"""
+        SELECT cm.id, cm.sender_id, cm.receiver_id, cm.message, cm.is_read, cm.created_at,
+               u.full_name AS sender_name
+        {conversation_filter}
+        ORDER BY cm.id {order}
+        LIMIT %s
+    """
+    query_params.append(limit + 1)
+    return history_query, query_params, order
+
+def build_archive_query(key: int, before_id: Optional[int], limit: int) -> Tuple[str, list]:
+    archive_filter = "WHERE cm.conversation_key = %s"
+    query_params: list = [key]
+    if before_id is not None:
+        archive_filter += " AND cm.id < %s"
+        query_params.append(before_id)
+    
+    archive_query = f"""
+        SELECT cm.id, cm.sender_id, cm.receiver_id, cm.message, cm.is_read, cm.created_at,
+               u.full_name AS sender_name
+        FROM chat_messages_archive cm
+        JOIN users u ON u.id = cm.sender_id
+        {archive_filter}
+        ORDER BY cm.id DESC
+        LIMIT %s
+    """
+    query_params.append(limit + 1)
+    return archive_query, query_params
+
+def build_history_json_query(key: int, since_id: Optional[int], since_ts: Optional[datetime],
+                             before_id: Optional[int], limit: int) -> Tuple[str, list]:
+    history_query, query_params, order = build_history_query(key, since_id, since_ts, before_id, limit)
+    
+    more_archived = ''
+    more_params: list = []
+    if order == 'DESC':
+        # The archive is read on scroll-back, or on a first page the live table cannot serve at all
+        page = f"""
+            live AS ({history_query}),
+            archived AS (
+                SELECT cm.id, cm.sender_id, cm.receiver_id, cm.message, cm.is_read, cm.created_at,
+                       u.full_name AS sender_name
+                FROM chat_messages_archive cm
+                JOIN users u ON u.id = cm.sender_id
+                WHERE cm.conversation_key = %s
+                    AND cm.id < COALESCE((SELECT MIN(id) FROM live), %s, 2147483647)
+                    AND (SELECT COUNT(*) FROM live) <= %s
+                    AND (%s OR NOT EXISTS (SELECT 1 FROM live))
+                ORDER BY cm.id DESC
+                LIMIT %s
+            ),
+            page AS (SELECT * FROM live UNION ALL SELECT * FROM archived)
+        """
+        query_params += [key, before_id, limit, before_id is not None, limit + 1]
+        # A short first page still has older history when the archive holds messages below it
+        more_archived = """
+            OR (%s AND (SELECT COUNT(*) FROM live) <= %s AND EXISTS (
+                SELECT 1 FROM chat_messages_archive ca
+                WHERE ca.conversation_key = %s AND ca.id < (SELECT MIN(id) FROM live)
+            ))
+        """
+        more_params = [before_id is None, limit, key]
+    else:
+        page = f"page AS ({history_query})"
+    
+    json_query = f"""
+        WITH {page},
+        trimmed AS (SELECT * FROM page ORDER BY id {order} LIMIT %s)
+        SELECT ((SELECT COUNT(*) FROM page) > %s {more_archived}) AS has_more,
+               MIN(id) AS first_id,
+               MAX(id) AS last_id,
+               COALESCE(json_agg(trimmed ORDER BY id), '[]')::text AS messages
+        FROM trimmed
+    """
+    query_params += [limit, limit] + more_params
+    return json_query, query_params
 
+@instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -37,7 +496,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -56,7 +515,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 401,
             'headers': response_headers,
-            'body': json.dumps({'error': 'Токен авторизации не предоставлен'}),
+            'body': to_json({'error': 'Токен авторизации не предоставлен'}),
             'isBase64Encoded': False
         }
     
@@ -65,24 +524,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 401,
             'headers': response_headers,
-            'body': json.dumps({'error': 'Недействительный токен'}),
+            'body': to_json({'error': 'Недействительный токен'}),
             'isBase64Encoded': False
         }
     
     user_id = payload.get('user_id')
     
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
+        user = resolve_user(cursor, payload)
         
         if not user:
             return {
-                'statusCode': 404,
+                'statusCode': 401,
                 'headers': response_headers,
-                'body': json.dumps({'error': 'Пользователь не найден'}),
+                'body': to_json({'error': 'Недействительный токен'}),
                 'isBase64Encoded': False
             }
         
@@ -94,43 +553,112 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': response_headers,
-                    'body': json.dumps({'error': 'other_user_id обязателен'}),
+                    'body': to_json({'error': 'other_user_id обязателен'}),
                     'isBase64Encoded': False
                 }
             
-            cursor.execute("""
-                SELECT cm.id, cm.sender_id, cm.receiver_id, cm.message, cm.is_read, cm.created_at,
-                       u.full_name
-                FROM chat_messages cm
-                JOIN users u ON u.id = cm.sender_id
-                WHERE (cm.sender_id = %s AND cm.receiver_id = %s)
-                   OR (cm.sender_id = %s AND cm.receiver_id = %s)
-                ORDER BY cm.created_at ASC
-            """, (user_id, other_user_id, other_user_id, user_id))
-            
-            messages = []
-            for row in cursor.fetchall():
-                messages.append({
-                    'id': row['id'],
-                    'sender_id': row['sender_id'],
-                    'receiver_id': row['receiver_id'],
-                    'message': row['message'],
-                    'is_read': row['is_read'],
-                    'created_at': row['created_at'].isoformat() if row['created_at'] else None,
-                    'sender_name': row['full_name']
-                })
+            try:
+                since_id = int(params['since_id']) if params.get('since_id') else None
+                before_id = int(params['before_id']) if params.get('before_id') else None
+                since_ts = datetime.fromisoformat(params['since_ts']) if params.get('since_ts') else None
+                limit = min(int(params.get('limit') or CHAT_PAGE_SIZE), CHAT_PAGE_SIZE_MAX)
+                wait = min(float(params.get('wait') or 0), CHAT_WAIT_MAX)
+            except ValueError:
+                return {
+                    'statusCode': 400,
+                    'headers': response_headers,
+                    'body': to_json({'error': 'Неверные параметры пагинации'}),
+                    'isBase64Encoded': False
+                }
+            
+            if limit < 1:
+                limit = CHAT_PAGE_SIZE
+            
+            try:
+                key = conversation_key(user_id, other_user_id)
+            except ValueError:
+                return {
+                    'statusCode': 400,
+                    'headers': response_headers,
+                    'body': to_json({'error': 'Неверный other_user_id'}),
+                    'isBase64Encoded': False
+                }
+            
+            history_query, query_params, order = build_history_query(key, since_id, since_ts, before_id, limit)
+            
+            long_poll = wait > 0 and order == 'ASC'
+            if long_poll:
+                listen_for_messages(conn, user_id)
+            
+            if JSON_PASSTHROUGH:
+                page_query, page_params = build_history_json_query(key, since_id, since_ts, before_id, limit)
+            else:
+                page_query, page_params = history_query, query_params
+            
+            try:
+                cursor.execute(page_query, page_params)
+                rows = cursor.fetchall()
+                empty = rows[0]['last_id'] is None if JSON_PASSTHROUGH else not rows
+                
+                if long_poll and empty and wait_for_message(conn, other_user_id, wait):
+                    cursor.execute(page_query, page_params)
+                    rows = cursor.fetchall()
+            finally:
+                if long_poll:
+                    stop_listening(conn)
+            
+            if JSON_PASSTHROUGH:
+                page = rows[0]
+                messages = RawJSON(page['messages'])
+                first_id, last_id, has_more = page['first_id'], page['last_id'], page['has_more']
+            else:
+                archived_older = False
+                if order == 'DESC' and len(rows) <= limit:
+                    if before_id is not None or not rows:
+                        # Scroll-back pages, and first pages with nothing live, continue in the archive
+                        oldest_id = rows[-1]['id'] if rows else before_id
+                        archive_query, archive_params = build_archive_query(key, oldest_id, limit - len(rows))
+                        cursor.execute(archive_query, archive_params)
+                        rows.extend(cursor.fetchall())
+                    else:
+                        # A short first page only needs to know whether scroll-back has anything to load
+                        cursor.execute("""
+                            SELECT EXISTS (
+                                SELECT 1 FROM chat_messages_archive
+                                WHERE conversation_key = %s AND id < %s
+                            ) AS archived_older
+                        """, (key, rows[-1]['id']))
+                        archived_older = cursor.fetchone()['archived_older']
+                
+                has_more = len(rows) > limit or archived_older
+                rows = rows[:limit]
+                if order == 'DESC':
+                    rows.reverse()
+                
+                messages = rows
+                first_id = rows[0]['id'] if rows else None
+                last_id = rows[-1]['id'] if rows else None
             
             cursor.execute("""
-                UPDATE chat_messages
-                SET is_read = TRUE
-                WHERE receiver_id = %s AND sender_id = %s AND is_read = FALSE
-            """, (user_id, other_user_id))
-            conn.commit()
+                SELECT id AS read_up_to_id
+                FROM chat_messages
+                WHERE conversation_key = %s AND sender_id = %s AND is_read = TRUE
+                ORDER BY id DESC
+                LIMIT 1
+            """, (key, user_id))
+            read_row = cursor.fetchone()
+            read_up_to_id = read_row['read_up_to_id'] if read_row else None
             
             return {
                 'statusCode': 200,
                 'headers': response_headers,
-                'body': json.dumps({'messages': messages}),
+                'body': to_json({
+                    'messages': messages,
+                    'last_id': last_id if last_id is not None else since_id,
+                    'first_id': first_id,
+                    'has_more': has_more,
+                    'read_up_to_id': read_up_to_id
+                }),
                 'isBase64Encoded': False
             }
         
@@ -146,31 +674,114 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': response_headers,
-                        'body': json.dumps({'error': 'receiver_id и message обязательны'}),
+                        'body': to_json({'error': 'receiver_id и message обязательны'}),
                         'isBase64Encoded': False
                     }
                 
                 cursor.execute("""
-                    INSERT INTO chat_messages (sender_id, receiver_id, message)
-                    VALUES (%s, %s, %s)
-                    RETURNING id
-                """, (user_id, receiver_id, message))
+                    WITH inserted AS (
+                        INSERT INTO chat_messages (sender_id, receiver_id, message)
+                        VALUES (%s, %s, %s)
+                        RETURNING id, sender_id, receiver_id, message, created_at
+                    ),
+                    conversations AS (
+                        INSERT INTO chat_conversations
+                        (user_id, other_user_id, unread_count, last_message_id, last_message, last_sender_id, last_message_at)
+                        SELECT receiver_id, sender_id, 1, id, LEFT(message, %s), sender_id, created_at FROM inserted
+                        UNION ALL
+                        SELECT sender_id, receiver_id, 0, id, LEFT(message, %s), sender_id, created_at FROM inserted
+                        WHERE sender_id <> receiver_id
+                        ON CONFLICT (user_id, other_user_id) DO UPDATE SET
+                            unread_count = chat_conversations.unread_count + EXCLUDED.unread_count,
+                            last_message_id = EXCLUDED.last_message_id,
+                            last_message = EXCLUDED.last_message,
+                            last_sender_id = EXCLUDED.last_sender_id,
+                            last_message_at = EXCLUDED.last_message_at
+                    )
+                    SELECT id FROM inserted
+                """, (user_id, receiver_id, message, CHAT_PREVIEW_LENGTH, CHAT_PREVIEW_LENGTH))
                 
                 message_id = cursor.fetchone()['id']
+                cursor.execute(
+                    "SELECT pg_notify(%s, %s)",
+                    (chat_channel(receiver_id), json.dumps({'sender_id': user_id, 'message_id': message_id}))
+                )
                 conn.commit()
                 
                 return {
                     'statusCode': 200,
                     'headers': response_headers,
-                    'body': json.dumps({'success': True, 'message_id': message_id}),
+                    'body': to_json({'success': True, 'message_id': message_id}),
+                    'isBase64Encoded': False
+                }
+            
+            elif action == 'ack':
+                other_user_id = body_data.get('other_user_id')
+                up_to_id = body_data.get('up_to_id')
+                
+                try:
+                    other_user_id = int(other_user_id)
+                    up_to_id = int(up_to_id)
+                    key = conversation_key(user_id, other_user_id)
+                except (TypeError, ValueError):
+                    return {
+                        'statusCode': 400,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'other_user_id и up_to_id обязательны'}),
+                        'isBase64Encoded': False
+                    }
+                
+                cursor.execute("""
+                    SELECT unread_count
+                    FROM chat_conversations
+                    WHERE user_id = %s AND other_user_id = %s
+                """, (user_id, other_user_id))
+                conversation = cursor.fetchone()
+                
+                if not conversation or conversation['unread_count'] <= 0:
+                    return {
+                        'statusCode': 200,
+                        'headers': response_headers,
+                        'body': to_json({'success': True, 'marked': 0, 'unread_count': 0}),
+                        'isBase64Encoded': False
+                    }
+                
+                cursor.execute("""
+                    WITH updated AS (
+                        UPDATE chat_messages
+                        SET is_read = TRUE
+                        WHERE conversation_key = %s AND receiver_id = %s AND is_read = FALSE AND id <= %s
+                        RETURNING id
+                    ),
+                    counter AS (
+                        UPDATE chat_conversations
+                        SET unread_count = GREATEST(unread_count - (SELECT COUNT(*) FROM updated), 0)
+                        WHERE user_id = %s AND other_user_id = %s
+                            AND EXISTS (SELECT 1 FROM updated)
+                        RETURNING unread_count
+                    )
+                    SELECT (SELECT COUNT(*) FROM updated) AS marked,
+                           (SELECT unread_count FROM counter) AS unread_count
+                """, (key, user_id, up_to_id, user_id, other_user_id))
+                
+                result = cursor.fetchone()
+                conn.commit()
+                
+                marked = result['marked']
+                unread_count = result['unread_count'] if marked else conversation['unread_count']
+                
+                return {
+                    'statusCode': 200,
+                    'headers': response_headers,
+                    'body': to_json({'success': True, 'marked': marked, 'unread_count': unread_count}),
                     'isBase64Encoded': False
                 }
             
             elif action == 'unread_count':
                 cursor.execute("""
-                    SELECT COUNT(*) as count
-                    FROM chat_messages
-                    WHERE receiver_id = %s AND is_read = FALSE
+                    SELECT COALESCE(SUM(unread_count), 0) as count
+                    FROM chat_conversations
+                    WHERE user_id = %s
                 """, (user_id,))
                 
                 unread_count = cursor.fetchone()['count']
@@ -178,7 +789,38 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 200,
                     'headers': response_headers,
-                    'body': json.dumps({'unread_count': unread_count}),
+                    'body': to_json({'unread_count': unread_count}),
+                    'isBase64Encoded': False
+                }
+            
+            elif action == 'inbox':
+                cursor.execute("""
+                    SELECT c.other_user_id, u.full_name, u.role, c.unread_count,
+                           c.last_message_id, c.last_message, c.last_sender_id, c.last_message_at
+                    FROM chat_conversations c
+                    JOIN users u ON u.id = c.other_user_id
+                    WHERE c.user_id = %s
+                    ORDER BY c.last_message_at DESC
+                    LIMIT %s
+                """, (user_id, CHAT_INBOX_SIZE))
+                
+                conversations = []
+                for row in cursor.fetchall():
+                    conversations.append({
+                        'other_user_id': row['other_user_id'],
+                        'other_user_name': row['full_name'],
+                        'other_user_role': row['role'],
+                        'unread_count': row['unread_count'],
+                        'last_message_id': row['last_message_id'],
+                        'last_message': row['last_message'],
+                        'last_sender_id': row['last_sender_id'],
+                        'last_message_at': row['last_message_at'].isoformat() if row['last_message_at'] else None
+                    })
+                
+                return {
+                    'statusCode': 200,
+                    'headers': response_headers,
+                    'body': to_json({'conversations': conversations}),
                     'isBase64Encoded': False
                 }
             
@@ -186,7 +828,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': response_headers,
-                    'body': json.dumps({'error': 'Неверное действие'}),
+                    'body': to_json({'error': 'Неверное действие'}),
                     'isBase64Encoded': False
                 }
         
@@ -194,7 +836,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 405,
                 'headers': response_headers,
-                'body': json.dumps({'error': 'Метод не поддерживается'}),
+                'body': to_json({'error': 'Метод не поддерживается'}),
                 'isBase64Encoded': False
             }
     
@@ -202,10 +844,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 500,
             'headers': response_headers,
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'}),
+            'body': to_json({'error': f'Ошибка сервера: {str(e)}'}),
             'isBase64Encoded': False
         }
     
     finally:
-        cursor.close()
-        conn.close()
+        if conn is not None:
+            release_db_connection(conn)
@@ -6,30 +6,437 @@ Returns: HTTP response with materials data
 
 import json
 import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import wraps
 import base64
+import gzip
+import hashlib
 import uuid
 import jwt
-from typing import Dict, Any, Optional
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple, Callable, List
 import psycopg2
+from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
-import boto3
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 JWT_SECRET = os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+S3_BUCKET = 'files'
+UPLOAD_PART_SIZE = int(os.environ.get('UPLOAD_PART_SIZE', str(5 * 1024 * 1024)))
+UPLOAD_PART_SIZE_MAX = int(os.environ.get('UPLOAD_PART_SIZE_MAX', str(10 * 1024 * 1024)))
+UPLOAD_TOKEN_TTL = timedelta(hours=24)
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev')
+PRESIGNED_URL_TTL = int(os.environ.get('PRESIGNED_URL_TTL', '3600'))
+MATERIAL_PREVIEW_LENGTH = 200
+MATERIALS_PAGE_SIZE = int(os.environ.get('MATERIALS_PAGE_SIZE', '50'))
+MATERIALS_PAGE_SIZE_MAX = 200
+JSON_PASSTHROUGH = os.environ.get('JSON_PASSTHROUGH', '0') == '1'
+
+TIMING_LOG = os.environ.get('TIMING_LOG', '1') == '1'
+TIMING_DEBUG = os.environ.get('TIMING_DEBUG', '0') == '1'
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+
+_request_timing: Optional[Dict[str, Any]] = None
+
+def normalize_sql(sql: Any) -> str:
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    return ' '.join(str(sql).split())
+
+@contextmanager
+def timed(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = _request_timing
+        if timing is not None:
+            timing['phases'][phase] = timing['phases'].get(phase, 0.0) + time.perf_counter() - started
+
+class TimedCursor(RealDictCursor):
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            timing = _request_timing
+            if timing is not None:
+                timing['queries'].append((query, time.perf_counter() - started))
+
+class RawJSON:
+    # JSON text that is already encoded (e.g. by json_agg in Postgres) and is embedded as-is
+    __slots__ = ('text',)
+    
+    def __init__(self, text: str):
+        self.text = text
+
+def json_default(value: Any) -> Any:
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, RawJSON) and orjson is not None:
+        return orjson.Fragment(value.text)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def to_json(data: Any) -> str:
+    with timed('serialize'):
+        if orjson is not None:
+            return orjson.dumps(data, default=json_default).decode('utf-8')
+        
+        fragments: List[str] = []
+        marker = uuid.uuid4().hex
+        
+        def default(value: Any) -> Any:
+            if isinstance(value, RawJSON):
+                fragments.append(value.text)
+                return f'{marker}:{len(fragments) - 1}'
+            return json_default(value)
+        
+        text = json.dumps(data, default=default)
+        for index, fragment in enumerate(fragments):
+            text = text.replace(f'"{marker}:{index}"', fragment, 1)
+        return text
+
+def request_action(event: Dict[str, Any]) -> Optional[str]:
+    params = event.get('queryStringParameters') or {}
+    if params.get('action'):
+        return params['action']
+    body = event.get('body') or ''
+    if body.startswith('{') and len(body) <= 65536:
+        try:
+            return json.loads(body).get('action')
+        except ValueError:
+            return None
+    return None
+
+def timing_summary(timing: Dict[str, Any], total: float) -> Dict[str, Any]:
+    queries: Dict[str, Dict[str, Any]] = {}
+    for sql, duration in timing['queries']:
+        entry = queries.setdefault(normalize_sql(sql), {'calls': 0, 'ms': 0.0})
+        entry['calls'] += 1
+        entry['ms'] += duration * 1000
+    return {
+        'total_ms': round(total * 1000, 2),
+        'phases': {name: round(duration * 1000, 2) for name, duration in timing['phases'].items()},
+        'db_ms': round(sum(duration for _, duration in timing['queries']) * 1000, 2),
+        'query_count': len(timing['queries']),
+        'queries': [{'sql': sql, 'calls': entry['calls'], 'ms': round(entry['ms'], 2)} for sql, entry in queries.items()]
+    }
+
+def server_timing_header(summary: Dict[str, Any]) -> str:
+    metrics = [f'{name};dur={duration}' for name, duration in summary['phases'].items()]
+    metrics.append(f'db;dur={summary["db_ms"]};desc="{summary["query_count"]} queries"')
+    metrics.append(f'total;dur={summary["total_ms"]}')
+    return ', '.join(metrics)
+
+def request_header(event: Dict[str, Any], name: str) -> str:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value or ''
+    return ''
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    encodings = []
+    for item in request_header(event, 'Accept-Encoding').split(','):
+        name, _, params = item.strip().partition(';')
+        if name and params.strip().replace(' ', '') not in ('q=0', 'q=0.0'):
+            encodings.append(name.strip().lower())
+    return encodings
+
+def prepare_response(event: Dict[str, Any], response: Dict[str, Any],
+                     debug_fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    body = response.get('body') or ''
+    if not body or response.get('isBase64Encoded'):
+        return response
+    headers = dict(response.get('headers') or {})
+    
+    if event.get('httpMethod') == 'GET' and response.get('statusCode') == 200:
+        # Weak validator: the same entity may be sent gzip, brotli or identity encoded
+        etag = 'W/"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+        headers['ETag'] = etag
+        headers.setdefault('Cache-Control', 'private, no-cache')
+        headers['Access-Control-Expose-Headers'] = 'ETag, Server-Timing'
+        if_none_match = request_header(event, 'If-None-Match')
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        if if_none_match.strip() == '*' or etag in candidates or etag[2:] in candidates:
+            return {**response, 'statusCode': 304, 'headers': headers, 'body': '', 'isBase64Encoded': False}
+    
+    # Debug fields change on every request, so they are added after the ETag is taken
+    if debug_fields and body.startswith('{'):
+        body = to_json({**json.loads(body), **debug_fields})
+    
+    raw = body.encode('utf-8')
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return {**response, 'headers': headers, 'body': body}
+    
+    encodings = accepted_encodings(event)
+    if 'br' in encodings and brotli is not None:
+        compressed, encoding = brotli.compress(raw, quality=BROTLI_QUALITY), 'br'
+    elif 'gzip' in encodings:
+        compressed, encoding = gzip.compress(raw, compresslevel=GZIP_LEVEL), 'gzip'
+    else:
+        return {**response, 'headers': headers, 'body': body}
+    
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def instrumented(func: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    @wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        global _request_timing
+        timing: Dict[str, Any] = {'phases': {}, 'queries': []}
+        _request_timing = timing
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+            debug_fields = {'_timing': timing_summary(timing, time.perf_counter() - started)} if TIMING_DEBUG else None
+            with timed('compress'):
+                response = prepare_response(event, response, debug_fields)
+        finally:
+            _request_timing = None
+        
+        summary = timing_summary(timing, time.perf_counter() - started)
+        response['headers'] = {
+            **(response.get('headers') or {}),
+            'Server-Timing': server_timing_header(summary),
+            'Timing-Allow-Origin': '*'
+        }
+        
+        if TIMING_LOG:
+            log_line = {
+                'type': 'timing',
+                'function': getattr(context, 'function_name', None),
+                'request_id': getattr(context, 'request_id', None),
+                'method': event.get('httpMethod'),
+                'action': request_action(event),
+                'status': response.get('statusCode'),
+                **summary
+            }
+            if response.get('statusCode', 200) >= 500:
+                log_line['error'] = response.get('body')
+            print(json.dumps(log_line, ensure_ascii=False))
+        
+        return response
+    return wrapper
 
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '1024'))
+# A bumped token_version reaches a warm instance within this many seconds; until then it still accepts older tokens
+TOKEN_VERSION_TTL = float(os.environ.get('TOKEN_VERSION_TTL', '60'))
+
+_token_cache: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+_token_versions: Dict[int, Tuple[int, str, float]] = {}
+
+@timed('auth')
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    payload = _token_cache.get(token_hash)
+    if payload is not None and payload.get('exp', 0) > time.time():
+        _token_cache.move_to_end(token_hash)
+        return payload
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-    except:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        _token_cache.pop(token_hash, None)
+        return None
+    _token_cache[token_hash] = payload
+    if len(_token_cache) > AUTH_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return payload
+
+@timed('auth')
+def resolve_user(cursor, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    user_id = payload.get('user_id')
+    cached = _token_versions.get(user_id)
+    # A token newer than the cached version was issued after a bump this process has not seen yet
+    if ('role' not in payload or cached is None or payload.get('tv', 0) > cached[0]
+            or time.monotonic() - cached[2] >= TOKEN_VERSION_TTL):
+        cursor.execute("SELECT role, token_version FROM users WHERE id = %s", (user_id,))
+        row = cursor.fetchone()
+        if not row:
+            _token_versions.pop(user_id, None)
+            return None
+        cached = (row['token_version'], row['role'], time.monotonic())
+        _token_versions[user_id] = cached
+    if payload.get('tv', 0) != cached[0]:
         return None
+    return {
+        'user_id': user_id,
+        'role': payload.get('role') or cached[1],
+        'class_name': payload.get('class_name')
+    }
+
+DB_SCHEMA = os.environ.get('DB_SCHEMA', 't_p91447108_ai_improvement_websi')
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_INTERVAL = float(os.environ.get('DB_POOL_PING_INTERVAL', '30'))
+
+_db_pool: Optional[pool.ThreadedConnectionPool] = None
+_db_last_used: Dict[int, float] = {}
+
+def get_db_pool() -> pool.ThreadedConnectionPool:
+    global _db_pool
+    if _db_pool is None or _db_pool.closed:
+        _db_pool = pool.ThreadedConnectionPool(
+            DB_POOL_MIN,
+            DB_POOL_MAX,
+            DATABASE_URL,
+            cursor_factory=TimedCursor,
+            options=f'-c search_path={DB_SCHEMA},public'
+        )
+    return _db_pool
 
+def is_connection_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    last_used = _db_last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as ping:
+            ping.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@timed('connect')
 def get_db_connection():
-    return psycopg2.connect(
-        DATABASE_URL,
-        cursor_factory=RealDictCursor,
-        options='-c search_path=t_p91447108_ai_improvement_websi,public'
+    db_pool = get_db_pool()
+    for _ in range(DB_POOL_MAX + 1):
+        conn = db_pool.getconn()
+        if is_connection_healthy(conn):
+            return conn
+        _db_last_used.pop(id(conn), None)
+        db_pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Не удалось получить соединение с базой данных')
+
+def release_db_connection(conn) -> None:
+    broken = conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+    if not broken and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    if broken:
+        _db_last_used.pop(id(conn), None)
+    else:
+        _db_last_used[id(conn)] = time.monotonic()
+    get_db_pool().putconn(conn, close=broken)
+
+_s3_client = None
+
+def get_s3_client():
+    # boto3 is imported on first use so requests that never touch S3 skip its import cost
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        _s3_client = boto3.client('s3',
+            endpoint_url=S3_ENDPOINT_URL,
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+        )
+    return _s3_client
+
+def build_object_key(file_name: str) -> str:
+    file_extension = file_name.split('.')[-1] if '.' in file_name else 'bin'
+    return f"materials/{uuid.uuid4()}.{file_extension}"
+
+def build_file_url(object_key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{object_key}"
+
+def generate_upload_token(upload: Dict[str, Any]) -> str:
+    payload = dict(upload, exp=datetime.utcnow() + UPLOAD_TOKEN_TTL)
+    return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
+
+def verify_upload_token(token: Optional[str], teacher_id: int, kind: str) -> Optional[Dict[str, Any]]:
+    if not token:
+        return None
+    try:
+        upload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    if upload.get('teacher_id') != teacher_id or upload.get('kind') != kind:
+        return None
+    return upload
+
+def object_key_from_url(file_url: str) -> Optional[str]:
+    marker = '/bucket/'
+    if marker not in file_url:
+        return None
+    return file_url.split(marker, 1)[1]
+
+def list_uploaded_parts(s3, upload: Dict[str, Any]) -> list:
+    parts = []
+    marker = 0
+    while True:
+        page = s3.list_parts(
+            Bucket=S3_BUCKET,
+            Key=upload['key'],
+            UploadId=upload['upload_id'],
+            PartNumberMarker=marker
+        )
+        parts.extend(page.get('Parts', []))
+        if not page.get('IsTruncated'):
+            return parts
+        marker = page['NextPartNumberMarker']
+
+def save_uploaded_material(cursor, teacher_id: int, upload: Dict[str, Any], file_url: str,
+                           file_size: int) -> Optional[int]:
+    # A repeated confirm or complete for the same object returns the material created the first time
+    cursor.execute("""
+        INSERT INTO learning_materials 
+        (teacher_id, title, description, file_url, file_type, file_size, category)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (file_url) WHERE file_url LIKE 'https://cdn.poehali.dev/%%' DO NOTHING
+        RETURNING id
+    """, (teacher_id, upload['title'], upload['description'], file_url,
+          upload['file_type'], file_size, upload['category']))
+    material = cursor.fetchone()
+    if not material:
+        material = find_uploaded_material(cursor, teacher_id, file_url)
+    return material['id'] if material else None
+
+def find_uploaded_material(cursor, teacher_id: int, file_url: str) -> Optional[Dict[str, Any]]:
+    cursor.execute(
+        "SELECT id FROM learning_materials WHERE file_url = %s AND teacher_id = %s",
+        (file_url, teacher_id)
     )
+    return cursor.fetchone()
+
+def encode_page_cursor(created_at: datetime, material_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{material_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
 
+def decode_page_cursor(cursor_value: str) -> Tuple[datetime, int]:
+    raw = base64.urlsafe_b64decode(cursor_value.encode('ascii')).decode('utf-8')
+    created_at, material_id = raw.split('|')
+    return datetime.fromisoformat(created_at), int(material_id)
+
+@instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -39,7 +446,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -58,7 +465,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 401,
             'headers': response_headers,
-            'body': json.dumps({'error': 'Токен авторизации не предоставлен'}),
+            'body': to_json({'error': 'Токен авторизации не предоставлен'}),
             'isBase64Encoded': False
         }
     
@@ -67,76 +474,212 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 401,
             'headers': response_headers,
-            'body': json.dumps({'error': 'Недействительный токен'}),
+            'body': to_json({'error': 'Недействительный токен'}),
             'isBase64Encoded': False
         }
     
     user_id = payload.get('user_id')
     
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
+        user = resolve_user(cursor, payload)
         
         if not user:
             return {
-                'statusCode': 404,
+                'statusCode': 401,
                 'headers': response_headers,
-                'body': json.dumps({'error': 'Пользователь не найден'}),
+                'body': to_json({'error': 'Недействительный токен'}),
                 'isBase64Encoded': False
             }
         
         user_role = user['role']
         
         if method == 'GET':
-            if user_role == 'teacher':
+            params = event.get('queryStringParameters') or {}
+            
+            try:
+                material_id = int(params['material_id']) if params.get('material_id') else None
+            except ValueError:
+                return {
+                    'statusCode': 400,
+                    'headers': response_headers,
+                    'body': to_json({'error': 'Неверный material_id'}),
+                    'isBase64Encoded': False
+                }
+            
+            if params.get('action') == 'download_url':
                 cursor.execute("""
-                    SELECT id, title, description, content, file_url, file_type, 
-                           file_size, category, created_at
-                    FROM learning_materials 
-                    WHERE teacher_id = %s 
-                    ORDER BY created_at DESC
-                """, (user_id,))
-            else:
+                    SELECT lm.file_url
+                    FROM learning_materials lm
+                    WHERE lm.id = %s
+                      AND (lm.teacher_id = %s OR EXISTS (
+                          SELECT 1 FROM teacher_students ts
+                          WHERE ts.teacher_id = lm.teacher_id AND ts.student_id = %s
+                      ))
+                """, (material_id, user_id, user_id))
+                material = cursor.fetchone()
+                object_key = object_key_from_url(material['file_url']) if material else None
+                
+                if not object_key:
+                    return {
+                        'statusCode': 404,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'Файл материала не найден'}),
+                        'isBase64Encoded': False
+                    }
+                
+                download_url = get_s3_client().generate_presigned_url(
+                    'get_object',
+                    Params={'Bucket': S3_BUCKET, 'Key': object_key},
+                    ExpiresIn=PRESIGNED_URL_TTL
+                )
+                
+                return {
+                    'statusCode': 200,
+                    'headers': response_headers,
+                    'body': to_json({'download_url': download_url, 'expires_in': PRESIGNED_URL_TTL}),
+                    'isBase64Encoded': False
+                }
+            
+            if material_id:
                 cursor.execute("""
-                    SELECT lm.id, lm.title, lm.description, lm.content, lm.file_url, 
+                    SELECT lm.id, lm.title, lm.description, lm.content, lm.file_url,
+                           lm.file_type, lm.file_size, lm.category, lm.created_at,
+                           u.full_name as teacher_name
+                    FROM learning_materials lm
+                    JOIN users u ON lm.teacher_id = u.id
+                    WHERE lm.id = %s
+                      AND (lm.teacher_id = %s OR EXISTS (
+                          SELECT 1 FROM teacher_students ts
+                          WHERE ts.teacher_id = lm.teacher_id AND ts.student_id = %s
+                      ))
+                """, (material_id, user_id, user_id))
+                row = cursor.fetchone()
+                
+                if not row:
+                    return {
+                        'statusCode': 404,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'Материал не найден'}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': response_headers,
+                    'body': to_json({
+                        'material': {
+                            'id': row['id'],
+                            'title': row['title'],
+                            'description': row['description'],
+                            'content': row['content'],
+                            'file_url': row['file_url'],
+                            'file_type': row['file_type'],
+                            'file_size': row['file_size'],
+                            'category': row['category'],
+                            'created_at': row['created_at'].isoformat() if row['created_at'] else None,
+                            'teacher_name': row['teacher_name']
+                        }
+                    }),
+                    'isBase64Encoded': False
+                }
+            
+            summary = params.get('view') == 'summary'
+            content_column = f"LEFT(lm.content, {MATERIAL_PREVIEW_LENGTH}) AS preview" if summary else "lm.content"
+            
+            try:
+                limit = min(int(params.get('limit') or MATERIALS_PAGE_SIZE), MATERIALS_PAGE_SIZE_MAX)
+                cursor_position = decode_page_cursor(params['cursor']) if params.get('cursor') else None
+                filter_teacher_id = int(params['teacher_id']) if params.get('teacher_id') else None
+            except ValueError:
+                return {
+                    'statusCode': 400,
+                    'headers': response_headers,
+                    'body': to_json({'error': 'Неверные параметры пагинации'}),
+                    'isBase64Encoded': False
+                }
+            
+            if limit < 1:
+                limit = MATERIALS_PAGE_SIZE
+            
+            if user_role == 'teacher':
+                list_query = f"""
+                    SELECT lm.id, lm.title, lm.description, {content_column}, lm.file_url, lm.file_type, 
+                           lm.file_size, lm.category, lm.created_at
+                    FROM learning_materials lm
+                    WHERE lm.teacher_id = %s 
+                """
+                query_params = [user_id]
+            else:
+                list_query = f"""
+                    SELECT lm.id, lm.title, lm.description, {content_column}, lm.file_url, 
                            lm.file_type, lm.file_size, lm.category, lm.created_at,
                            u.full_name as teacher_name
                     FROM learning_materials lm
                     JOIN teacher_students ts ON lm.teacher_id = ts.teacher_id
                     JOIN users u ON lm.teacher_id = u.id
                     WHERE ts.student_id = %s
-                    ORDER BY lm.created_at DESC
-                """, (user_id,))
+                """
+                query_params = [user_id]
+                if filter_teacher_id is not None:
+                    list_query += " AND lm.teacher_id = %s"
+                    query_params.append(filter_teacher_id)
             
-            materials = []
-            rows = cursor.fetchall()
-            print(f"Found {len(rows)} materials for user_id={user_id}, role={user_role}")
-            
-            for row in rows:
-                material = {
-                    'id': row['id'],
-                    'title': row['title'],
-                    'description': row['description'],
-                    'content': row.get('content'),
-                    'file_url': row['file_url'],
-                    'file_type': row['file_type'],
-                    'file_size': row['file_size'],
-                    'category': row['category'],
-                    'created_at': row['created_at'].isoformat() if row['created_at'] else None
+            if params.get('category'):
+                list_query += " AND lm.category = %s"
+                query_params.append(params['category'])
+            if params.get('file_type'):
+                list_query += " AND lm.file_type = %s"
+                query_params.append(params['file_type'])
+            if cursor_position:
+                list_query += " AND (lm.created_at, lm.id) < (%s, %s)"
+                query_params.extend(cursor_position)
+            
+            list_query += " ORDER BY lm.created_at DESC, lm.id DESC LIMIT %s"
+            query_params.append(limit + 1)
+            
+            if JSON_PASSTHROUGH:
+                cursor.execute(f"""
+                    WITH page AS ({list_query}),
+                    trimmed AS (SELECT * FROM page ORDER BY created_at DESC, id DESC LIMIT %s),
+                    last_row AS (SELECT created_at, id FROM trimmed ORDER BY created_at, id LIMIT 1)
+                    SELECT (SELECT COUNT(*) FROM page) > %s AS has_more,
+                           (SELECT created_at FROM last_row) AS last_created_at,
+                           (SELECT id FROM last_row) AS last_id,
+                           (SELECT COALESCE(json_agg(trimmed ORDER BY created_at DESC, id DESC), '[]')::text FROM trimmed) AS materials
+                """, query_params + [limit, limit])
+                page = cursor.fetchone()
+                next_cursor = encode_page_cursor(page['last_created_at'], page['last_id']) if page['has_more'] else None
+                
+                return {
+                    'statusCode': 200,
+                    'headers': response_headers,
+                    'body': to_json({
+                        'materials': RawJSON(page['materials']),
+                        'next_cursor': next_cursor
+                    }),
+                    'isBase64Encoded': False
                 }
-                if user_role == 'student':
-                    material['teacher_name'] = row['teacher_name']
-                materials.append(material)
             
-            print(f"Returning {len(materials)} materials")
+            cursor.execute(list_query, query_params)
+            
+            # Rows already carry the response fields; to_json serializes them and their timestamps directly
+            rows = cursor.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            
+            next_cursor = encode_page_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_more else None
             
             return {
                 'statusCode': 200,
                 'headers': response_headers,
-                'body': json.dumps({'materials': materials}),
+                'body': to_json({
+                    'materials': rows,
+                    'next_cursor': next_cursor
+                }),
                 'isBase64Encoded': False
             }
         
@@ -145,7 +688,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 403,
                     'headers': response_headers,
-                    'body': json.dumps({'error': 'Только преподаватели могут загружать материалы'}),
+                    'body': to_json({'error': 'Только преподаватели могут загружать материалы'}),
                     'isBase64Encoded': False
                 }
             
@@ -162,7 +705,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': response_headers,
-                        'body': json.dumps({'error': 'Название и содержание обязательны'}),
+                        'body': to_json({'error': 'Название и содержание обязательны'}),
                         'isBase64Encoded': False
                     }
                 
@@ -179,7 +722,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 200,
                     'headers': response_headers,
-                    'body': json.dumps({
+                    'body': to_json({
                         'success': True,
                         'material_id': material_id
                     }),
@@ -198,30 +741,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return {
                         'statusCode': 400,
                         'headers': response_headers,
-                        'body': json.dumps({'error': 'Название, файл и имя файла обязательны'}),
+                        'body': to_json({'error': 'Название, файл и имя файла обязательны'}),
                         'isBase64Encoded': False
                     }
                 
                 file_data = base64.b64decode(file_base64)
                 file_size = len(file_data)
                 
-                file_extension = file_name.split('.')[-1] if '.' in file_name else 'bin'
-                unique_filename = f"materials/{uuid.uuid4()}.{file_extension}"
+                unique_filename = build_object_key(file_name)
                 
-                s3 = boto3.client('s3',
-                    endpoint_url='https://bucket.poehali.dev',
-                    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-                    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-                )
+                s3 = get_s3_client()
                 
                 s3.put_object(
-                    Bucket='files',
+                    Bucket=S3_BUCKET,
                     Key=unique_filename,
                     Body=file_data,
                     ContentType=file_type
                 )
                 
-                file_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{unique_filename}"
+                file_url = build_file_url(unique_filename)
                 
                 cursor.execute("""
                     INSERT INTO learning_materials 
@@ -236,7 +774,267 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 200,
                     'headers': response_headers,
-                    'body': json.dumps({
+                    'body': to_json({
+                        'success': True,
+                        'material_id': material_id,
+                        'file_url': file_url
+                    }),
+                    'isBase64Encoded': False
+                }
+            
+            elif action == 'upload_init':
+                title = body_data.get('title', '').strip()
+                file_name = body_data.get('file_name')
+                file_type = body_data.get('file_type', 'application/octet-stream')
+                
+                if not title or not file_name:
+                    return {
+                        'statusCode': 400,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'Название и имя файла обязательны'}),
+                        'isBase64Encoded': False
+                    }
+                
+                object_key = build_object_key(file_name)
+                multipart = get_s3_client().create_multipart_upload(
+                    Bucket=S3_BUCKET,
+                    Key=object_key,
+                    ContentType=file_type
+                )
+                
+                upload_token = generate_upload_token({
+                    'kind': 'multipart',
+                    'teacher_id': user_id,
+                    'upload_id': multipart['UploadId'],
+                    'key': object_key,
+                    'title': title,
+                    'description': body_data.get('description', '').strip(),
+                    'file_type': file_type,
+                    'category': body_data.get('category', 'Общее')
+                })
+                
+                return {
+                    'statusCode': 200,
+                    'headers': response_headers,
+                    'body': to_json({
+                        'success': True,
+                        'upload_token': upload_token,
+                        'part_size': UPLOAD_PART_SIZE
+                    }),
+                    'isBase64Encoded': False
+                }
+            
+            elif action == 'upload_part':
+                upload = verify_upload_token(body_data.get('upload_token'), user_id, 'multipart')
+                part_number = body_data.get('part_number')
+                chunk_base64 = body_data.get('chunk_base64')
+                
+                if not upload or not isinstance(part_number, int) or not 1 <= part_number <= 10000 or not chunk_base64:
+                    return {
+                        'statusCode': 400,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'upload_token, part_number и chunk_base64 обязательны'}),
+                        'isBase64Encoded': False
+                    }
+                
+                if len(chunk_base64) // 4 * 3 > UPLOAD_PART_SIZE_MAX:
+                    return {
+                        'statusCode': 413,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'Часть файла слишком большая'}),
+                        'isBase64Encoded': False
+                    }
+                
+                chunk = base64.b64decode(chunk_base64)
+                del body_data['chunk_base64'], chunk_base64
+                
+                part = get_s3_client().upload_part(
+                    Bucket=S3_BUCKET,
+                    Key=upload['key'],
+                    UploadId=upload['upload_id'],
+                    PartNumber=part_number,
+                    Body=chunk
+                )
+                
+                return {
+                    'statusCode': 200,
+                    'headers': response_headers,
+                    'body': to_json({
+                        'success': True,
+                        'part_number': part_number,
+                        'etag': part['ETag'],
+                        'size': len(chunk)
+                    }),
+                    'isBase64Encoded': False
+                }
+            
+            elif action == 'upload_complete':
+                upload = verify_upload_token(body_data.get('upload_token'), user_id, 'multipart')
+                
+                if not upload:
+                    return {
+                        'statusCode': 400,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'Неверный upload_token'}),
+                        'isBase64Encoded': False
+                    }
+                
+                file_url = build_file_url(upload['key'])
+                s3 = get_s3_client()
+                try:
+                    parts = list_uploaded_parts(s3, upload)
+                    
+                    if not parts:
+                        return {
+                            'statusCode': 400,
+                            'headers': response_headers,
+                            'body': to_json({'error': 'Не загружено ни одной части файла'}),
+                            'isBase64Encoded': False
+                        }
+                    
+                    s3.complete_multipart_upload(
+                        Bucket=S3_BUCKET,
+                        Key=upload['key'],
+                        UploadId=upload['upload_id'],
+                        MultipartUpload={
+                            'Parts': [{'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in parts]
+                        }
+                    )
+                except s3.exceptions.ClientError as error:
+                    if error.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+                        return {
+                            'statusCode': 502,
+                            'headers': response_headers,
+                            'body': to_json({'error': 'Хранилище файлов не приняло загрузку'}),
+                            'isBase64Encoded': False
+                        }
+                    
+                    # A retry after a successful complete finds the multipart upload already gone
+                    material = find_uploaded_material(cursor, user_id, file_url)
+                    if not material:
+                        return {
+                            'statusCode': 409,
+                            'headers': response_headers,
+                            'body': to_json({'error': 'Загрузка не найдена: начните её заново'}),
+                            'isBase64Encoded': False
+                        }
+                    return {
+                        'statusCode': 200,
+                        'headers': response_headers,
+                        'body': to_json({
+                            'success': True,
+                            'material_id': material['id'],
+                            'file_url': file_url
+                        }),
+                        'isBase64Encoded': False
+                    }
+                
+                file_size = sum(p['Size'] for p in parts)
+                material_id = save_uploaded_material(cursor, user_id, upload, file_url, file_size)
+                conn.commit()
+                
+                if not material_id:
+                    return {
+                        'statusCode': 409,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'Файл уже привязан к другому материалу'}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': response_headers,
+                    'body': to_json({
+                        'success': True,
+                        'material_id': material_id,
+                        'file_url': file_url
+                    }),
+                    'isBase64Encoded': False
+                }
+            
+            elif action == 'presign_upload':
+                title = body_data.get('title', '').strip()
+                file_name = body_data.get('file_name')
+                file_type = body_data.get('file_type', 'application/octet-stream')
+                
+                if not title or not file_name:
+                    return {
+                        'statusCode': 400,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'Название и имя файла обязательны'}),
+                        'isBase64Encoded': False
+                    }
+                
+                object_key = build_object_key(file_name)
+                upload_url = get_s3_client().generate_presigned_url(
+                    'put_object',
+                    Params={'Bucket': S3_BUCKET, 'Key': object_key, 'ContentType': file_type},
+                    ExpiresIn=PRESIGNED_URL_TTL
+                )
+                
+                upload_token = generate_upload_token({
+                    'kind': 'presigned',
+                    'teacher_id': user_id,
+                    'key': object_key,
+                    'title': title,
+                    'description': body_data.get('description', '').strip(),
+                    'file_type': file_type,
+                    'category': body_data.get('category', 'Общее')
+                })
+                
+                return {
+                    'statusCode': 200,
+                    'headers': response_headers,
+                    'body': to_json({
+                        'success': True,
+                        'upload_url': upload_url,
+                        'upload_method': 'PUT',
+                        'upload_headers': {'Content-Type': file_type},
+                        'upload_token': upload_token,
+                        'expires_in': PRESIGNED_URL_TTL
+                    }),
+                    'isBase64Encoded': False
+                }
+            
+            elif action == 'confirm_upload':
+                upload = verify_upload_token(body_data.get('upload_token'), user_id, 'presigned')
+                
+                if not upload:
+                    return {
+                        'statusCode': 400,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'Неверный upload_token'}),
+                        'isBase64Encoded': False
+                    }
+                
+                s3 = get_s3_client()
+                try:
+                    uploaded = s3.head_object(Bucket=S3_BUCKET, Key=upload['key'])
+                except s3.exceptions.ClientError:
+                    return {
+                        'statusCode': 409,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'Файл ещё не загружен в хранилище'}),
+                        'isBase64Encoded': False
+                    }
+                
+                file_url = build_file_url(upload['key'])
+                
+                material_id = save_uploaded_material(cursor, user_id, upload, file_url, uploaded['ContentLength'])
+                conn.commit()
+                
+                if not material_id:
+                    return {
+                        'statusCode': 409,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'Файл уже привязан к другому материалу'}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': response_headers,
+                    'body': to_json({
                         'success': True,
                         'material_id': material_id,
                         'file_url': file_url
@@ -244,11 +1042,35 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
+            elif action == 'upload_abort':
+                upload = verify_upload_token(body_data.get('upload_token'), user_id, 'multipart')
+                
+                if not upload:
+                    return {
+                        'statusCode': 400,
+                        'headers': response_headers,
+                        'body': to_json({'error': 'Неверный upload_token'}),
+                        'isBase64Encoded': False
+                    }
+                
+                get_s3_client().abort_multipart_upload(
+                    Bucket=S3_BUCKET,
+                    Key=upload['key'],
+                    UploadId=upload['upload_id']
+                )
+                
+                return {
+                    'statusCode': 200,
+                    'headers': response_headers,
+                    'body': to_json({'success': True}),
+                    'isBase64Encoded': False
+                }
+            
             else:
                 return {
                     'statusCode': 400,
                     'headers': response_headers,
-                    'body': json.dumps({'error': 'Неверное действие'}),
+                    'body': to_json({'error': 'Неверное действие'}),
                     'isBase64Encoded': False
                 }
         
@@ -257,7 +1079,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 403,
                     'headers': response_headers,
-                    'body': json.dumps({'error': 'Только преподаватели могут редактировать материалы'}),
+                    'body': to_json({'error': 'Только преподаватели могут редактировать материалы'}),
                     'isBase64Encoded': False
                 }
             
@@ -272,7 +1094,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': response_headers,
-                    'body': json.dumps({'error': 'ID материала, название и содержание обязательны'}),
+                    'body': to_json({'error': 'ID материала, название и содержание обязательны'}),
                     'isBase64Encoded': False
                 }
             
@@ -287,7 +1109,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 404,
                     'headers': response_headers,
-                    'body': json.dumps({'error': 'Материал не найден или у вас нет прав на его редактирование'}),
+                    'body': to_json({'error': 'Материал не найден или у вас нет прав на его редактирование'}),
                     'isBase64Encoded': False
                 }
             
@@ -296,7 +1118,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': response_headers,
-                'body': json.dumps({'success': True}),
+                'body': to_json({'success': True}),
                 'isBase64Encoded': False
             }
         
@@ -305,7 +1127,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 403,
                     'headers': response_headers,
-                    'body': json.dumps({'error': 'Только преподаватели могут удалять материалы'}),
+                    'body': to_json({'error': 'Только преподаватели могут удалять материалы'}),
                     'isBase64Encoded': False
                 }
             
@@ -316,7 +1138,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 400,
                     'headers': response_headers,
-                    'body': json.dumps({'error': 'ID материала не указан'}),
+                    'body': to_json({'error': 'ID материала не указан'}),
                     'isBase64Encoded': False
                 }
             
@@ -330,17 +1152,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': response_headers,
-                'body': json.dumps({'success': True}),
+                'body': to_json({'success': True}),
                 'isBase64Encoded': False
             }
         
-        cursor.close()
-        conn.close()
-        
         return {
             'statusCode': 405,
             'headers': response_headers,
-            'body': json.dumps({'error': 'Метод не поддерживается'}),
+            'body': to_json({'error': 'Метод не поддерживается'}),
             'isBase64Encoded': False
         }
         
@@ -348,6 +1167,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 500,
             'headers': response_headers,
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'}),
+            'body': to_json({'error': f'Ошибка сервера: {str(e)}'}),
             'isBase64Encoded': False
-        }
\ No newline at end of file
+        }
+    
+    finally:
+        if conn is not None:
+            release_db_connection(conn)
@@ -4,26 +4,340 @@ Args: event with httpMethod, body, headers; context with request_id
 Returns: HTTP response with progress data
 """
 
+import base64
+import gzip
+import hashlib
 import json
 import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import wraps
 import jwt
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple, Callable, List
 import psycopg2
+from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 DATABASE_URL = os.environ.get('DATABASE_URL')
 JWT_SECRET = os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
 
+TIMING_LOG = os.environ.get('TIMING_LOG', '1') == '1'
+TIMING_DEBUG = os.environ.get('TIMING_DEBUG', '0') == '1'
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+
+_request_timing: Optional[Dict[str, Any]] = None
+
+def normalize_sql(sql: Any) -> str:
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    return ' '.join(str(sql).split())
+
+@contextmanager
+def timed(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = _request_timing
+        if timing is not None:
+            timing['phases'][phase] = timing['phases'].get(phase, 0.0) + time.perf_counter() - started
+
+class TimedCursor(RealDictCursor):
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            timing = _request_timing
+            if timing is not None:
+                timing['queries'].append((query, time.perf_counter() - started))
+
+class RawJSON:
+    # JSON text that is already encoded (e.g. by json_agg in Postgres) and is embedded as-is
+    __slots__ = ('text',)
+    
+    def __init__(self, text: str):
+        self.text = text
+
+def json_default(value: Any) -> Any:
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, RawJSON) and orjson is not None:
+        return orjson.Fragment(value.text)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def to_json(data: Any) -> str:
+    with timed('serialize'):
+        if orjson is not None:
+            return orjson.dumps(data, default=json_default).decode('utf-8')
+        
+        fragments: List[str] = []
+        marker = uuid.uuid4().hex
+        
+        def default(value: Any) -> Any:
+            if isinstance(value, RawJSON):
+                fragments.append(value.text)
+                return f'{marker}:{len(fragments) - 1}'
+            return json_default(value)
+        
+        text = json.dumps(data, default=default)
+        for index, fragment in enumerate(fragments):
+            text = text.replace(f'"{marker}:{index}"', fragment, 1)
+        return text
+
+def request_action(event: Dict[str, Any]) -> Optional[str]:
+    params = event.get('queryStringParameters') or {}
+    if params.get('action'):
+        return params['action']
+    body = event.get('body') or ''
+    if body.startswith('{') and len(body) <= 65536:
+        try:
+            return json.loads(body).get('action')
+        except ValueError:
+            return None
+    return None
+
+def timing_summary(timing: Dict[str, Any], total: float) -> Dict[str, Any]:
+    queries: Dict[str, Dict[str, Any]] = {}
+    for sql, duration in timing['queries']:
+        entry = queries.setdefault(normalize_sql(sql), {'calls': 0, 'ms': 0.0})
+        entry['calls'] += 1
+        entry['ms'] += duration * 1000
+    return {
+        'total_ms': round(total * 1000, 2),
+        'phases': {name: round(duration * 1000, 2) for name, duration in timing['phases'].items()},
+        'db_ms': round(sum(duration for _, duration in timing['queries']) * 1000, 2),
+        'query_count': len(timing['queries']),
+        'queries': [{'sql': sql, 'calls': entry['calls'], 'ms': round(entry['ms'], 2)} for sql, entry in queries.items()]
+    }
+
+def server_timing_header(summary: Dict[str, Any]) -> str:
+    metrics = [f'{name};dur={duration}' for name, duration in summary['phases'].items()]
+    metrics.append(f'db;dur={summary["db_ms"]};desc="{summary["query_count"]} queries"')
+    metrics.append(f'total;dur={summary["total_ms"]}')
+    return ', '.join(metrics)
+
+def request_header(event: Dict[str, Any], name: str) -> str:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value or ''
+    return ''
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    encodings = []
+    for item in request_header(event, 'Accept-Encoding').split(','):
+        name, _, params = item.strip().partition(';')
+        if name and params.strip().replace(' ', '') not in ('q=0', 'q=0.0'):
+            encodings.append(name.strip().lower())
+    return encodings
+
+def prepare_response(event: Dict[str, Any], response: Dict[str, Any],
+                     debug_fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    body = response.get('body') or ''
+    if not body or response.get('isBase64Encoded'):
+        return response
+    headers = dict(response.get('headers') or {})
+    
+    if event.get('httpMethod') == 'GET' and response.get('statusCode') == 200:
+        # Weak validator: the same entity may be sent gzip, brotli or identity encoded
+        etag = 'W/"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+        headers['ETag'] = etag
+        headers.setdefault('Cache-Control', 'private, no-cache')
+        headers['Access-Control-Expose-Headers'] = 'ETag, Server-Timing'
+        if_none_match = request_header(event, 'If-None-Match')
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        if if_none_match.strip() == '*' or etag in candidates or etag[2:] in candidates:
+            return {**response, 'statusCode': 304, 'headers': headers, 'body': '', 'isBase64Encoded': False}
+    
+    # Debug fields change on every request, so they are added after the ETag is taken
+    if debug_fields and body.startswith('{'):
+        body = to_json({**json.loads(body), **debug_fields})
+    
+    raw = body.encode('utf-8')
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return {**response, 'headers': headers, 'body': body}
+    
+    encodings = accepted_encodings(event)
+    if 'br' in encodings and brotli is not None:
+        compressed, encoding = brotli.compress(raw, quality=BROTLI_QUALITY), 'br'
+    elif 'gzip' in encodings:
+        compressed, encoding = gzip.compress(raw, compresslevel=GZIP_LEVEL), 'gzip'
+    else:
+        return {**response, 'headers': headers, 'body': body}
+    
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def instrumented(func: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    @wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        global _request_timing
+        timing: Dict[str, Any] = {'phases': {}, 'queries': []}
+        _request_timing = timing
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+            debug_fields = {'_timing': timing_summary(timing, time.perf_counter() - started)} if TIMING_DEBUG else None
+            with timed('compress'):
+                response = prepare_response(event, response, debug_fields)
+        finally:
+            _request_timing = None
+        
+        summary = timing_summary(timing, time.perf_counter() - started)
+        response['headers'] = {
+            **(response.get('headers') or {}),
+            'Server-Timing': server_timing_header(summary),
+            'Timing-Allow-Origin': '*'
+        }
+        
+        if TIMING_LOG:
+            log_line = {
+                'type': 'timing',
+                'function': getattr(context, 'function_name', None),
+                'request_id': getattr(context, 'request_id', None),
+                'method': event.get('httpMethod'),
+                'action': request_action(event),
+                'status': response.get('statusCode'),
+                **summary
+            }
+            if response.get('statusCode', 200) >= 500:
+                log_line['error'] = response.get('body')
+            print(json.dumps(log_line, ensure_ascii=False))
+        
+        return response
+    return wrapper
+
+DB_SCHEMA = os.environ.get('DB_SCHEMA', 't_p91447108_ai_improvement_websi')
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_INTERVAL = float(os.environ.get('DB_POOL_PING_INTERVAL', '30'))
+
+_db_pool: Optional[pool.ThreadedConnectionPool] = None
+_db_last_used: Dict[int, float] = {}
+
+def get_db_pool() -> pool.ThreadedConnectionPool:
+    global _db_pool
+    if _db_pool is None or _db_pool.closed:
+        _db_pool = pool.ThreadedConnectionPool(
+            DB_POOL_MIN,
+            DB_POOL_MAX,
+            DATABASE_URL,
+            cursor_factory=TimedCursor,
+            options=f'-c search_path={DB_SCHEMA},public'
+        )
+    return _db_pool
+
+def is_connection_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    last_used = _db_last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as ping:
+            ping.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@timed('connect')
 def get_db_connection():
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+    db_pool = get_db_pool()
+    for _ in range(DB_POOL_MAX + 1):
+        conn = db_pool.getconn()
+        if is_connection_healthy(conn):
+            return conn
+        _db_last_used.pop(id(conn), None)
+        db_pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Не удалось получить соединение с базой данных')
 
+def release_db_connection(conn) -> None:
+    broken = conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+    if not broken and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    if broken:
+        _db_last_used.pop(id(conn), None)
+    else:
+        _db_last_used[id(conn)] = time.monotonic()
+    get_db_pool().putconn(conn, close=broken)
+
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '1024'))
+# A bumped token_version reaches a warm instance within this many seconds; until then it still accepts older tokens
+TOKEN_VERSION_TTL = float(os.environ.get('TOKEN_VERSION_TTL', '60'))
+
+_token_cache: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+_token_versions: Dict[int, Tuple[int, str, float]] = {}
+
+@timed('auth')
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    payload = _token_cache.get(token_hash)
+    if payload is not None and payload.get('exp', 0) > time.time():
+        _token_cache.move_to_end(token_hash)
+        return payload
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-    except:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        _token_cache.pop(token_hash, None)
+        return None
+    _token_cache[token_hash] = payload
+    if len(_token_cache) > AUTH_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return payload
+
+@timed('auth')
+def resolve_user(cursor, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    user_id = payload.get('user_id')
+    cached = _token_versions.get(user_id)
+    # A token newer than the cached version was issued after a bump this process has not seen yet
+    if ('role' not in payload or cached is None or payload.get('tv', 0) > cached[0]
+            or time.monotonic() - cached[2] >= TOKEN_VERSION_TTL):
+        cursor.execute("SELECT role, token_version FROM users WHERE id = %s", (user_id,))
+        row = cursor.fetchone()
+        if not row:
+            _token_versions.pop(user_id, None)
+            return None
+        cached = (row['token_version'], row['role'], time.monotonic())
+        _token_versions[user_id] = cached
+    if payload.get('tv', 0) != cached[0]:
         return None
+    return {
+        'user_id': user_id,
+        'role': payload.get('role') or cached[1],
+        'class_name': payload.get('class_name')
+    }
 
+@instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -33,7 +347,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -50,7 +364,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 401,
             'headers': headers,
-            'body': json.dumps({'error': 'Токен авторизации не предоставлен'})
+            'body': to_json({'error': 'Токен авторизации не предоставлен'})
         }
     
     payload = verify_token(auth_token)
@@ -58,130 +372,110 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 401,
             'headers': headers,
-            'body': json.dumps({'error': 'Недействительный токен'})
+            'body': to_json({'error': 'Недействительный токен'})
         }
     
     user_id = payload.get('user_id')
     
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
+        if not resolve_user(cursor, payload):
+            return {
+                'statusCode': 401,
+                'headers': headers,
+                'body': to_json({'error': 'Недействительный токен'})
+            }
+        
         if method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
             action = body_data.get('action')
             
             if action == 'save_test_result':
-                test_result = {
-                    'topic': body_data.get('topic', 'Тест'),
-                    'score': body_data.get('score', 0),
-                    'total_questions': body_data.get('total_questions', 0),
-                    'correct_answers': body_data.get('correct_answers', 0),
-                    'date': datetime.utcnow().isoformat()
-                }
-                
                 cursor.execute(
-                    "SELECT test_results FROM user_progress WHERE user_id = %s",
-                    (user_id,)
-                )
-                row = cursor.fetchone()
-                
-                if row:
-                    current_results = row['test_results'] or []
-                    current_results.append(test_result)
-                    
-                    cursor.execute(
-                        "UPDATE user_progress SET test_results = %s, last_activity = %s WHERE user_id = %s",
-                        (json.dumps(current_results), datetime.utcnow(), user_id)
+                    """
+                    WITH inserted AS (
+                        INSERT INTO test_results (user_id, topic, score, total_questions, correct_answers, created_at)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        RETURNING user_id, score, created_at
                     )
-                else:
-                    cursor.execute(
-                        "INSERT INTO user_progress (user_id, test_results, last_activity) VALUES (%s, %s, %s)",
-                        (user_id, json.dumps([test_result]), datetime.utcnow())
+                    INSERT INTO user_progress (user_id, tests_completed, score_sum, last_activity)
+                    SELECT user_id, 1, score, created_at FROM inserted
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        tests_completed = user_progress.tests_completed + 1,
+                        score_sum = user_progress.score_sum + EXCLUDED.score_sum,
+                        last_activity = EXCLUDED.last_activity
+                    """,
+                    (
+                        user_id,
+                        body_data.get('topic', 'Тест'),
+                        body_data.get('score', 0),
+                        body_data.get('total_questions', 0),
+                        body_data.get('correct_answers', 0),
+                        datetime.utcnow()
                     )
+                )
                 
                 conn.commit()
                 
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'success': True, 'message': 'Результат сохранён'})
+                    'body': to_json({'success': True, 'message': 'Результат сохранён'})
                 }
             
             elif action == 'save_completed_topic':
                 topic = body_data.get('topic', '')
                 
                 cursor.execute(
-                    "SELECT completed_topics FROM user_progress WHERE user_id = %s",
-                    (user_id,)
+                    """
+                    INSERT INTO user_progress (user_id, completed_topics, last_activity)
+                    VALUES (%s, jsonb_build_array(%s::text), %s)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        completed_topics = CASE
+                            WHEN user_progress.completed_topics @> EXCLUDED.completed_topics
+                                THEN user_progress.completed_topics
+                            ELSE COALESCE(user_progress.completed_topics, '[]'::jsonb) || EXCLUDED.completed_topics
+                        END,
+                        last_activity = EXCLUDED.last_activity
+                    """,
+                    (user_id, topic, datetime.utcnow())
                 )
-                row = cursor.fetchone()
-                
-                if row:
-                    current_topics = row['completed_topics'] or []
-                    if topic not in current_topics:
-                        current_topics.append(topic)
-                        
-                        cursor.execute(
-                            "UPDATE user_progress SET completed_topics = %s, last_activity = %s WHERE user_id = %s",
-                            (json.dumps(current_topics), datetime.utcnow(), user_id)
-                        )
-                else:
-                    cursor.execute(
-                        "INSERT INTO user_progress (user_id, completed_topics, last_activity) VALUES (%s, %s, %s)",
-                        (user_id, json.dumps([topic]), datetime.utcnow())
-                    )
                 
                 conn.commit()
                 
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'success': True, 'message': 'Тема отмечена как изученная'})
+                    'body': to_json({'success': True, 'message': 'Тема отмечена как изученная'})
                 }
             
             elif action == 'mark_lecture_viewed':
-                lecture_data = {
-                    'title': body_data.get('title', ''),
-                    'duration': body_data.get('duration', ''),
-                    'viewed_at': datetime.utcnow().isoformat()
-                }
-                
                 cursor.execute(
-                    "SELECT viewed_lectures FROM user_progress WHERE user_id = %s",
-                    (user_id,)
-                )
-                row = cursor.fetchone()
-                
-                if row:
-                    viewed_lectures = row['viewed_lectures'] or []
-                    
-                    # Check if lecture already viewed (by title)
-                    existing = next((i for i, l in enumerate(viewed_lectures) if l.get('title') == lecture_data['title']), None)
-                    
-                    if existing is not None:
-                        # Update view time
-                        viewed_lectures[existing] = lecture_data
-                    else:
-                        # Add new lecture
-                        viewed_lectures.append(lecture_data)
-                    
-                    cursor.execute(
-                        "UPDATE user_progress SET viewed_lectures = %s, last_activity = %s WHERE user_id = %s",
-                        (json.dumps(viewed_lectures), datetime.utcnow(), user_id)
-                    )
-                else:
-                    cursor.execute(
-                        "INSERT INTO user_progress (user_id, viewed_lectures, last_activity) VALUES (%s, %s, %s)",
-                        (user_id, json.dumps([lecture_data]), datetime.utcnow())
+                    """
+                    WITH viewed AS (
+                        INSERT INTO lecture_views (user_id, lecture_title, duration, viewed_at)
+                        VALUES (%s, %s, %s, %s)
+                        ON CONFLICT (user_id, lecture_title) DO UPDATE SET
+                            duration = EXCLUDED.duration,
+                            viewed_at = EXCLUDED.viewed_at
+                        RETURNING user_id, viewed_at
                     )
+                    INSERT INTO user_progress (user_id, last_activity)
+                    SELECT user_id, viewed_at FROM viewed
+                    ON CONFLICT (user_id) DO UPDATE SET last_activity = EXCLUDED.last_activity
+                    """,
+                    (user_id, body_data.get('title', ''), body_data.get('duration', ''), datetime.utcnow())
+                )
                 
                 conn.commit()
                 
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'success': True, 'message': 'Лекция отмечена как просмотренная'})
+                    'body': to_json({'success': True, 'message': 'Лекция отмечена как просмотренная'})
                 }
         
         elif method == 'GET':
@@ -204,7 +498,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({
+                    'body': to_json({
                         'teachers': [
                             {
                                 'id': t['id'],
@@ -219,7 +513,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             cursor.execute(
                 """
                 SELECT u.id, u.email, u.full_name, u.created_at,
-                       up.test_results, up.completed_topics, up.viewed_lectures, up.last_activity
+                       up.completed_topics, up.last_activity,
+                       up.tests_completed, up.score_sum
                 FROM users u
                 LEFT JOIN user_progress up ON u.id = up.user_id
                 WHERE u.id = %s
@@ -232,38 +527,80 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return {
                     'statusCode': 404,
                     'headers': headers,
-                    'body': json.dumps({'error': 'Пользователь не найден'})
+                    'body': to_json({'error': 'Пользователь не найден'})
+                }
+            
+            cursor.execute(
+                """
+                SELECT topic, score, total_questions, correct_answers, created_at
+                FROM test_results
+                WHERE user_id = %s
+                ORDER BY id
+                """,
+                (user_id,)
+            )
+            test_results = [
+                {
+                    'topic': r['topic'],
+                    'score': r['score'],
+                    'total_questions': r['total_questions'],
+                    'correct_answers': r['correct_answers'],
+                    'date': r['created_at'].isoformat() if r['created_at'] else None
                 }
+                for r in cursor.fetchall()
+            ]
+            cursor.execute(
+                """
+                SELECT lecture_title, duration, viewed_at
+                FROM lecture_views
+                WHERE user_id = %s
+                ORDER BY id
+                """,
+                (user_id,)
+            )
+            viewed_lectures = [
+                {
+                    'title': l['lecture_title'],
+                    'duration': l['duration'],
+                    'viewed_at': l['viewed_at'].isoformat() if l['viewed_at'] else None
+                }
+                for l in cursor.fetchall()
+            ]
+            tests_completed = user['tests_completed'] or 0
+            average_score = user['score_sum'] / tests_completed if tests_completed > 0 else 0
             
             return {
                 'statusCode': 200,
                 'headers': headers,
-                'body': json.dumps({
+                'body': to_json({
                     'user': {
                         'id': user['id'],
                         'email': user['email'],
                         'full_name': user['full_name'],
                         'created_at': user['created_at'].isoformat(),
-                        'test_results': user['test_results'] or [],
+                        'test_results': test_results,
+                        'tests_completed': tests_completed,
+                        'average_score': round(average_score, 1),
                         'completed_topics': user['completed_topics'] or [],
-                        'viewed_lectures': user['viewed_lectures'] or [],
+                        'viewed_lectures': viewed_lectures,
                         'last_activity': user['last_activity'].isoformat() if user['last_activity'] else None
                     }
                 })
             }
         
-        cursor.close()
-        conn.close()
-        
         return {
             'statusCode': 405,
             'headers': headers,
-            'body': json.dumps({'error': 'Метод не поддерживается'})
+            'body': to_json({'error': 'Метод не поддерживается'})
         }
         
     except Exception as e:
         return {
             'statusCode': 500,
             'headers': headers,
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'})
-        }
\ No newline at end of file
+            'body': to_json({'error': f'Ошибка сервера: {str(e)}'})
+        }
+    
+    finally:
+        if conn is not None:
+            release_db_connection(conn)
@@ -4,25 +4,366 @@ Args: event with httpMethod, body, headers; context with request_id
 Returns: HTTP response with student data or operation results
 """
 
+import csv
+import base64
+import gzip
+import hashlib
+import io
 import json
 import os
-from typing import Dict, Any, Optional
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import wraps
+from typing import Dict, Any, Optional, Tuple, List, Callable
 import psycopg2
+from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
 import jwt
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 DATABASE_URL = os.environ.get('DATABASE_URL')
 JWT_SECRET = os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+BULK_ENROLL_LIMIT = 500
+BULK_STATUS_LIMIT = 2000
+MATERIAL_STATUSES = ('not_started', 'in_progress', 'completed', 'needs_review')
+JSON_PASSTHROUGH = os.environ.get('JSON_PASSTHROUGH', '0') == '1'
+
+TIMING_LOG = os.environ.get('TIMING_LOG', '1') == '1'
+TIMING_DEBUG = os.environ.get('TIMING_DEBUG', '0') == '1'
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+
+_request_timing: Optional[Dict[str, Any]] = None
+
+def normalize_sql(sql: Any) -> str:
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    return ' '.join(str(sql).split())
+
+@contextmanager
+def timed(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = _request_timing
+        if timing is not None:
+            timing['phases'][phase] = timing['phases'].get(phase, 0.0) + time.perf_counter() - started
+
+class TimedCursor(RealDictCursor):
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            timing = _request_timing
+            if timing is not None:
+                timing['queries'].append((query, time.perf_counter() - started))
+
+class RawJSON:
+    # JSON text that is already encoded (e.g. by json_agg in Postgres) and is embedded as-is
+    __slots__ = ('text',)
+    
+    def __init__(self, text: str):
+        self.text = text
+
+def json_default(value: Any) -> Any:
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, RawJSON) and orjson is not None:
+        return orjson.Fragment(value.text)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def to_json(data: Any) -> str:
+    with timed('serialize'):
+        if orjson is not None:
+            return orjson.dumps(data, default=json_default).decode('utf-8')
+        
+        fragments: List[str] = []
+        marker = uuid.uuid4().hex
+        
+        def default(value: Any) -> Any:
+            if isinstance(value, RawJSON):
+                fragments.append(value.text)
+                return f'{marker}:{len(fragments) - 1}'
+            return json_default(value)
+        
+        text = json.dumps(data, default=default)
+        for index, fragment in enumerate(fragments):
+            text = text.replace(f'"{marker}:{index}"', fragment, 1)
+        return text
+
+def request_action(event: Dict[str, Any]) -> Optional[str]:
+    params = event.get('queryStringParameters') or {}
+    if params.get('action'):
+        return params['action']
+    body = event.get('body') or ''
+    if body.startswith('{') and len(body) <= 65536:
+        try:
+            return json.loads(body).get('action')
+        except ValueError:
+            return None
+    return None
+
+def timing_summary(timing: Dict[str, Any], total: float) -> Dict[str, Any]:
+    queries: Dict[str, Dict[str, Any]] = {}
+    for sql, duration in timing['queries']:
+        entry = queries.setdefault(normalize_sql(sql), {'calls': 0, 'ms': 0.0})
+        entry['calls'] += 1
+        entry['ms'] += duration * 1000
+    return {
+        'total_ms': round(total * 1000, 2),
+        'phases': {name: round(duration * 1000, 2) for name, duration in timing['phases'].items()},
+        'db_ms': round(sum(duration for _, duration in timing['queries']) * 1000, 2),
+        'query_count': len(timing['queries']),
+        'queries': [{'sql': sql, 'calls': entry['calls'], 'ms': round(entry['ms'], 2)} for sql, entry in queries.items()]
+    }
+
+def server_timing_header(summary: Dict[str, Any]) -> str:
+    metrics = [f'{name};dur={duration}' for name, duration in summary['phases'].items()]
+    metrics.append(f'db;dur={summary["db_ms"]};desc="{summary["query_count"]} queries"')
+    metrics.append(f'total;dur={summary["total_ms"]}')
+    return ', '.join(metrics)
+
+def request_header(event: Dict[str, Any], name: str) -> str:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value or ''
+    return ''
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    encodings = []
+    for item in request_header(event, 'Accept-Encoding').split(','):
+        name, _, params = item.strip().partition(';')
+        if name and params.strip().replace(' ', '') not in ('q=0', 'q=0.0'):
+            encodings.append(name.strip().lower())
+    return encodings
+
+def prepare_response(event: Dict[str, Any], response: Dict[str, Any],
+                     debug_fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    body = response.get('body') or ''
+    if not body or response.get('isBase64Encoded'):
+        return response
+    headers = dict(response.get('headers') or {})
+    
+    if event.get('httpMethod') == 'GET' and response.get('statusCode') == 200:
+        # Weak validator: the same entity may be sent gzip, brotli or identity encoded
+        etag = 'W/"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+        headers['ETag'] = etag
+        headers.setdefault('Cache-Control', 'private, no-cache')
+        headers['Access-Control-Expose-Headers'] = 'ETag, Server-Timing'
+        if_none_match = request_header(event, 'If-None-Match')
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        if if_none_match.strip() == '*' or etag in candidates or etag[2:] in candidates:
+            return {**response, 'statusCode': 304, 'headers': headers, 'body': '', 'isBase64Encoded': False}
+    
+    # Debug fields change on every request, so they are added after the ETag is taken
+    if debug_fields and body.startswith('{'):
+        body = to_json({**json.loads(body), **debug_fields})
+    
+    raw = body.encode('utf-8')
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return {**response, 'headers': headers, 'body': body}
+    
+    encodings = accepted_encodings(event)
+    if 'br' in encodings and brotli is not None:
+        compressed, encoding = brotli.compress(raw, quality=BROTLI_QUALITY), 'br'
+    elif 'gzip' in encodings:
+        compressed, encoding = gzip.compress(raw, compresslevel=GZIP_LEVEL), 'gzip'
+    else:
+        return {**response, 'headers': headers, 'body': body}
+    
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def instrumented(func: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    @wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        global _request_timing
+        timing: Dict[str, Any] = {'phases': {}, 'queries': []}
+        _request_timing = timing
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+            debug_fields = {'_timing': timing_summary(timing, time.perf_counter() - started)} if TIMING_DEBUG else None
+            with timed('compress'):
+                response = prepare_response(event, response, debug_fields)
+        finally:
+            _request_timing = None
+        
+        summary = timing_summary(timing, time.perf_counter() - started)
+        response['headers'] = {
+            **(response.get('headers') or {}),
+            'Server-Timing': server_timing_header(summary),
+            'Timing-Allow-Origin': '*'
+        }
+        
+        if TIMING_LOG:
+            log_line = {
+                'type': 'timing',
+                'function': getattr(context, 'function_name', None),
+                'request_id': getattr(context, 'request_id', None),
+                'method': event.get('httpMethod'),
+                'action': request_action(event),
+                'status': response.get('statusCode'),
+                **summary
+            }
+            if response.get('statusCode', 200) >= 500:
+                log_line['error'] = response.get('body')
+            print(json.dumps(log_line, ensure_ascii=False))
+        
+        return response
+    return wrapper
+
+DB_SCHEMA = os.environ.get('DB_SCHEMA', 't_p91447108_ai_improvement_websi')
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_INTERVAL = float(os.environ.get('DB_POOL_PING_INTERVAL', '30'))
+
+_db_pool: Optional[pool.ThreadedConnectionPool] = None
+_db_last_used: Dict[int, float] = {}
+
+def get_db_pool() -> pool.ThreadedConnectionPool:
+    global _db_pool
+    if _db_pool is None or _db_pool.closed:
+        _db_pool = pool.ThreadedConnectionPool(
+            DB_POOL_MIN,
+            DB_POOL_MAX,
+            DATABASE_URL,
+            cursor_factory=TimedCursor,
+            options=f'-c search_path={DB_SCHEMA},public'
+        )
+    return _db_pool
+
+def is_connection_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    last_used = _db_last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as ping:
+            ping.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
+@timed('connect')
 def get_db_connection():
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+    db_pool = get_db_pool()
+    for _ in range(DB_POOL_MAX + 1):
+        conn = db_pool.getconn()
+        if is_connection_healthy(conn):
+            return conn
+        _db_last_used.pop(id(conn), None)
+        db_pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Не удалось получить соединение с базой данных')
 
+def release_db_connection(conn) -> None:
+    broken = conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+    if not broken and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    if broken:
+        _db_last_used.pop(id(conn), None)
+    else:
+        _db_last_used[id(conn)] = time.monotonic()
+    get_db_pool().putconn(conn, close=broken)
+
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '1024'))
+# A bumped token_version reaches a warm instance within this many seconds; until then it still accepts older tokens
+TOKEN_VERSION_TTL = float(os.environ.get('TOKEN_VERSION_TTL', '60'))
+
+_token_cache: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+_token_versions: Dict[int, Tuple[int, str, float]] = {}
+
+@timed('auth')
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    payload = _token_cache.get(token_hash)
+    if payload is not None and payload.get('exp', 0) > time.time():
+        _token_cache.move_to_end(token_hash)
+        return payload
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-    except:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        _token_cache.pop(token_hash, None)
+        return None
+    _token_cache[token_hash] = payload
+    if len(_token_cache) > AUTH_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return payload
+
+@timed('auth')
+def resolve_user(cursor, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    user_id = payload.get('user_id')
+    cached = _token_versions.get(user_id)
+    # A token newer than the cached version was issued after a bump this process has not seen yet
+    if ('role' not in payload or cached is None or payload.get('tv', 0) > cached[0]
+            or time.monotonic() - cached[2] >= TOKEN_VERSION_TTL):
+        cursor.execute("SELECT role, token_version FROM users WHERE id = %s", (user_id,))
+        row = cursor.fetchone()
+        if not row:
+            _token_versions.pop(user_id, None)
+            return None
+        cached = (row['token_version'], row['role'], time.monotonic())
+        _token_versions[user_id] = cached
+    if payload.get('tv', 0) != cached[0]:
         return None
+    return {
+        'user_id': user_id,
+        'role': payload.get('role') or cached[1],
+        'class_name': payload.get('class_name')
+    }
 
+def parse_student_entries(body_data: Dict[str, Any]) -> List[Dict[str, str]]:
+    emails = body_data.get('emails') or []
+    csv_text = body_data.get('csv')
+    if not isinstance(emails, list) or not all(isinstance(email, str) for email in emails):
+        raise ValueError('emails должен быть списком строк')
+    if csv_text is not None and not isinstance(csv_text, str):
+        raise ValueError('csv должен быть строкой')
+    
+    entries = [{'email': email.strip().lower(), 'class_name': ''} for email in emails]
+    
+    if csv_text:
+        rows = [row for row in csv.reader(io.StringIO(csv_text)) if row and row[0].strip()]
+        if rows and rows[0][0].strip().lower() == 'email':
+            rows = rows[1:]
+        for row in rows:
+            entries.append({
+                'email': row[0].strip().lower(),
+                'class_name': row[1].strip() if len(row) > 1 else ''
+            })
+    return entries
+
+@instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -32,7 +373,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -43,6 +384,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
+    conn = None
     try:
         auth_token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
         
@@ -50,7 +392,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 401,
                 'headers': headers,
-                'body': json.dumps({'error': 'Токен авторизации не предоставлен'})
+                'body': to_json({'error': 'Токен авторизации не предоставлен'})
             }
         
         payload = verify_token(auth_token)
@@ -58,7 +400,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 401,
                 'headers': headers,
-                'body': json.dumps({'error': 'Недействительный токен'})
+                'body': to_json({'error': 'Недействительный токен'})
             }
         
         teacher_id = payload.get('user_id')
@@ -66,16 +408,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT role FROM users WHERE id = %s", (teacher_id,))
-        user = cursor.fetchone()
+        user = resolve_user(cursor, payload)
         
         if not user or user['role'] != 'teacher':
-            cursor.close()
-            conn.close()
             return {
                 'statusCode': 403,
                 'headers': headers,
-                'body': json.dumps({'error': 'Доступ запрещен. Только для преподавателей'})
+                'body': to_json({'error': 'Доступ запрещен. Только для преподавателей'})
             }
         
         if method == 'GET':
@@ -86,7 +425,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 cursor.execute(
                     """
                     SELECT u.id, u.email, u.full_name, u.created_at,
-                           up.test_results, up.completed_topics, up.last_activity
+                           up.completed_topics, up.last_activity,
+                           up.tests_completed, up.average_score
                     FROM users u
                     LEFT JOIN user_progress up ON u.id = up.user_id
                     WHERE u.id = %s AND u.role = 'student'
@@ -96,75 +436,87 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 student = cursor.fetchone()
                 
                 if not student:
-                    cursor.close()
-                    conn.close()
                     return {
                         'statusCode': 404,
                         'headers': headers,
-                        'body': json.dumps({'error': 'Студент не найден'})
+                        'body': to_json({'error': 'Студент не найден'})
                     }
                 
-                test_results = student['test_results'] or []
-                tests_completed = len(test_results)
-                average_score = sum(r.get('score', 0) for r in test_results) / tests_completed if tests_completed > 0 else 0
-                
-                cursor.close()
-                conn.close()
+                cursor.execute(
+                    """
+                    SELECT topic, score, total_questions, correct_answers, created_at
+                    FROM test_results
+                    WHERE user_id = %s
+                    ORDER BY id
+                    """,
+                    (student_id,)
+                )
+                test_results = [
+                    {
+                        'topic': r['topic'],
+                        'score': r['score'],
+                        'total_questions': r['total_questions'],
+                        'correct_answers': r['correct_answers'],
+                        'date': r['created_at'].isoformat() if r['created_at'] else None
+                    }
+                    for r in cursor.fetchall()
+                ]
                 
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({
+                    'body': to_json({
                         'student': {
                             'id': student['id'],
                             'full_name': student['full_name'],
                             'email': student['email'],
                             'created_at': student['created_at'].isoformat(),
-                            'tests_completed': tests_completed,
-                            'average_score': round(average_score, 1),
+                            'tests_completed': student['tests_completed'] or 0,
+                            'average_score': student['average_score'] or 0,
                             'test_results': test_results,
                             'completed_topics': student['completed_topics'] or [],
                             'last_activity': student['last_activity'].isoformat() if student['last_activity'] else None
                         }
                     })
                 }
+            elif JSON_PASSTHROUGH:
+                cursor.execute(
+                    """
+                    SELECT COALESCE(json_agg(json_build_object(
+                        'id', student_id,
+                        'full_name', full_name,
+                        'email', email,
+                        'tests_completed', tests_completed,
+                        'average_score', average_score,
+                        'last_activity', last_activity
+                    ) ORDER BY created_at DESC, student_id DESC), '[]')::text AS students
+                    FROM teacher_roster
+                    WHERE teacher_id = %s
+                    """,
+                    (teacher_id,)
+                )
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': to_json({'students': RawJSON(cursor.fetchone()['students'])})
+                }
             else:
                 cursor.execute(
                     """
-                    SELECT u.id, u.email, u.full_name, u.created_at,
-                           up.test_results, up.last_activity
-                    FROM users u
-                    LEFT JOIN user_progress up ON u.id = up.user_id
-                    INNER JOIN teacher_students ts ON ts.student_id = u.id
-                    WHERE u.role = 'student' AND ts.teacher_id = %s
-                    ORDER BY u.created_at DESC
+                    SELECT student_id AS id, full_name, email, tests_completed, average_score, last_activity
+                    FROM teacher_roster
+                    WHERE teacher_id = %s
+                    ORDER BY created_at DESC, student_id DESC
                     """,
                     (teacher_id,)
                 )
                 students = cursor.fetchall()
                 
-                students_list = []
-                for student in students:
-                    test_results = student['test_results'] or []
-                    tests_completed = len(test_results)
-                    average_score = sum(r.get('score', 0) for r in test_results) / tests_completed if tests_completed > 0 else 0
-                    
-                    students_list.append({
-                        'id': student['id'],
-                        'full_name': student['full_name'],
-                        'email': student['email'],
-                        'tests_completed': tests_completed,
-                        'average_score': round(average_score, 1),
-                        'last_activity': student['last_activity'].isoformat() if student['last_activity'] else None
-                    })
-                
-                cursor.close()
-                conn.close()
-                
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'students': students_list})
+                    'body': to_json({'students': students})
                 }
         
         elif method == 'POST':
@@ -176,12 +528,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 message = body_data.get('message', '').strip()
                 
                 if not student_id or not message:
-                    cursor.close()
-                    conn.close()
                     return {
                         'statusCode': 400,
                         'headers': headers,
-                        'body': json.dumps({'error': 'ID студента и сообщение обязательны'})
+                        'body': to_json({'error': 'ID студента и сообщение обязательны'})
                     }
                 
                 cursor.execute(
@@ -195,13 +545,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 result = cursor.fetchone()
                 conn.commit()
                 
-                cursor.close()
-                conn.close()
-                
                 return {
                     'statusCode': 201,
                     'headers': headers,
-                    'body': json.dumps({
+                    'body': to_json({
                         'success': True,
                         'message_id': result['id'],
                         'sent_at': result['created_at'].isoformat()
@@ -215,12 +562,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 teacher_comment = body_data.get('teacher_comment', '')
                 
                 if not material_id or not student_id or not status:
-                    cursor.close()
-                    conn.close()
                     return {
                         'statusCode': 400,
                         'headers': headers,
-                        'body': json.dumps({'error': 'material_id, student_id и status обязательны'})
+                        'body': to_json({'error': 'material_id, student_id и status обязательны'})
                     }
                 
                 cursor.execute(
@@ -239,25 +584,131 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
                 conn.commit()
                 
-                cursor.close()
-                conn.close()
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': to_json({'success': True})
+                }
+            
+            elif action == 'update_material_statuses':
+                updates = {}
+                rejected = []
+                for item in body_data.get('updates') or []:
+                    try:
+                        pair = (int(item['material_id']), int(item['student_id']))
+                    except (KeyError, TypeError, ValueError):
+                        rejected.append(item)
+                        continue
+                    if item.get('status') not in MATERIAL_STATUSES:
+                        rejected.append(item)
+                        continue
+                    updates[pair] = (item['status'], item.get('teacher_comment', ''))
+                
+                if not updates:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': to_json({'error': 'updates должен содержать material_id, student_id и корректный status'})
+                    }
+                
+                if len(updates) > BULK_STATUS_LIMIT:
+                    return {
+                        'statusCode': 413,
+                        'headers': headers,
+                        'body': to_json({'error': f'Не более {BULK_STATUS_LIMIT} статусов за один запрос'})
+                    }
+                
+                pairs = list(updates.keys())
+                cursor.execute(
+                    """
+                    INSERT INTO material_status
+                    (material_id, student_id, status, teacher_comment, reviewed_at, updated_at)
+                    SELECT u.material_id, u.student_id, u.status, u.teacher_comment, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+                    FROM unnest(%s::int[], %s::int[], %s::text[], %s::text[])
+                        AS u(material_id, student_id, status, teacher_comment)
+                    JOIN learning_materials lm ON lm.id = u.material_id AND lm.teacher_id = %s
+                    JOIN teacher_students ts ON ts.student_id = u.student_id AND ts.teacher_id = %s
+                    ON CONFLICT (material_id, student_id)
+                    DO UPDATE SET 
+                        status = EXCLUDED.status,
+                        teacher_comment = EXCLUDED.teacher_comment,
+                        reviewed_at = CURRENT_TIMESTAMP,
+                        updated_at = CURRENT_TIMESTAMP
+                    RETURNING material_id, student_id
+                    """,
+                    (
+                        [p[0] for p in pairs],
+                        [p[1] for p in pairs],
+                        [updates[p][0] for p in pairs],
+                        [updates[p][1] for p in pairs],
+                        teacher_id,
+                        teacher_id
+                    )
+                )
+                saved = {(row['material_id'], row['student_id']) for row in cursor.fetchall()}
+                conn.commit()
+                
+                rejected.extend(
+                    {'material_id': p[0], 'student_id': p[1]} for p in pairs if p not in saved
+                )
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': to_json({'success': True, 'updated': len(saved), 'rejected': rejected})
+                }
+            
+            elif action == 'get_status_matrix':
+                raw_material_ids = body_data.get('material_ids') or []
+                try:
+                    if not isinstance(raw_material_ids, list):
+                        raise TypeError
+                    material_ids = [int(m) for m in raw_material_ids]
+                except (TypeError, ValueError):
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': to_json({'error': 'material_ids должен быть списком целых чисел'})
+                    }
+                
+                matrix_query = """
+                    SELECT ms.material_id, ms.student_id, ms.status, ms.teacher_comment, ms.updated_at
+                    FROM learning_materials lm
+                    JOIN material_status ms ON ms.material_id = lm.id
+                    JOIN teacher_students ts ON ts.student_id = ms.student_id AND ts.teacher_id = lm.teacher_id
+                    WHERE lm.teacher_id = %s
+                """
+                query_params = [teacher_id]
+                if material_ids:
+                    matrix_query += " AND lm.id = ANY(%s)"
+                    query_params.append(material_ids)
+                
+                cursor.execute(matrix_query, query_params)
+                
+                statuses = []
+                for row in cursor.fetchall():
+                    statuses.append({
+                        'material_id': row['material_id'],
+                        'student_id': row['student_id'],
+                        'status': row['status'],
+                        'teacher_comment': row['teacher_comment'],
+                        'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None
+                    })
                 
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'success': True})
+                    'body': to_json({'default_status': 'not_started', 'statuses': statuses})
                 }
             
             elif action == 'get_material_statuses':
                 material_id = body_data.get('material_id')
                 
                 if not material_id:
-                    cursor.close()
-                    conn.close()
                     return {
                         'statusCode': 400,
                         'headers': headers,
-                        'body': json.dumps({'error': 'material_id обязателен'})
+                        'body': to_json({'error': 'material_id обязателен'})
                     }
                 
                 cursor.execute(
@@ -283,37 +734,30 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None
                     })
                 
-                cursor.close()
-                conn.close()
-                
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'statuses': statuses})
+                    'body': to_json({'statuses': statuses})
                 }
             
             elif action == 'add_student':
                 email = body_data.get('email', '').strip().lower()
                 
                 if not email:
-                    cursor.close()
-                    conn.close()
                     return {
                         'statusCode': 400,
                         'headers': headers,
-                        'body': json.dumps({'error': 'Email обязателен'})
+                        'body': to_json({'error': 'Email обязателен'})
                     }
                 
                 cursor.execute("SELECT id FROM users WHERE email = %s AND role = 'student'", (email,))
                 student = cursor.fetchone()
                 
                 if not student:
-                    cursor.close()
-                    conn.close()
                     return {
                         'statusCode': 404,
                         'headers': headers,
-                        'body': json.dumps({'error': 'Студент с таким email не найден'})
+                        'body': to_json({'error': 'Студент с таким email не найден'})
                     }
                 
                 cursor.execute(
@@ -326,27 +770,116 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
                 conn.commit()
                 
-                cursor.close()
-                conn.close()
-                
                 return {
                     'statusCode': 201,
                     'headers': headers,
-                    'body': json.dumps({'success': True, 'message': 'Студент добавлен'})
+                    'body': to_json({'success': True, 'message': 'Студент добавлен'})
+                }
+            
+            elif action == 'add_students':
+                try:
+                    entries = parse_student_entries(body_data)
+                except ValueError as error:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': to_json({'error': str(error)})
+                    }
+                
+                if not entries:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': to_json({'error': 'Передайте список emails или csv'})
+                    }
+                
+                if len(entries) > BULK_ENROLL_LIMIT:
+                    return {
+                        'statusCode': 413,
+                        'headers': headers,
+                        'body': to_json({'error': f'Не более {BULK_ENROLL_LIMIT} студентов за один запрос'})
+                    }
+                
+                emails = [e['email'] for e in entries if '@' in e['email']]
+                found = {}
+                if emails:
+                    cursor.execute(
+                        "SELECT id, email FROM users WHERE email = ANY(%s) AND role = 'student'",
+                        (emails,)
+                    )
+                    found = {row['email']: row['id'] for row in cursor.fetchall()}
+                
+                student_ids = sorted(set(found.values()))
+                added = set()
+                if student_ids:
+                    cursor.execute(
+                        """
+                        INSERT INTO teacher_students (teacher_id, student_id)
+                        SELECT %s, student_id FROM unnest(%s::int[]) AS student_id
+                        ON CONFLICT (teacher_id, student_id) DO NOTHING
+                        RETURNING student_id
+                        """,
+                        (teacher_id, student_ids)
+                    )
+                    added = {row['student_id'] for row in cursor.fetchall()}
+                
+                # Only students linked by this call: an existing account's class belongs to whoever enrolled it first
+                class_updates = {
+                    found[e['email']]: e['class_name']
+                    for e in entries
+                    if e['email'] in found and found[e['email']] in added and e['class_name']
+                }
+                if class_updates:
+                    cursor.execute(
+                        """
+                        UPDATE users u SET class_name = c.class_name
+                        FROM unnest(%s::int[], %s::text[]) AS c(id, class_name)
+                        WHERE u.id = c.id
+                        """,
+                        (list(class_updates.keys()), list(class_updates.values()))
+                    )
+                
+                conn.commit()
+                
+                results = []
+                for entry in entries:
+                    email = entry['email']
+                    if '@' not in email:
+                        results.append({'email': email, 'status': 'invalid'})
+                    elif email not in found:
+                        results.append({'email': email, 'status': 'not_found'})
+                    else:
+                        student_id = found[email]
+                        results.append({
+                            'email': email,
+                            'student_id': student_id,
+                            'status': 'added' if student_id in added else 'already_added'
+                        })
+                        added.discard(student_id)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': to_json({
+                        'success': True,
+                        'added': sum(1 for r in results if r['status'] == 'added'),
+                        'results': results
+                    })
                 }
-        
-        cursor.close()
-        conn.close()
         
         return {
             'statusCode': 405,
             'headers': headers,
-            'body': json.dumps({'error': 'Метод не поддерживается'})
+            'body': to_json({'error': 'Метод не поддерживается'})
         }
         
     except Exception as e:
         return {
             'statusCode': 500,
             'headers': headers,
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'})
-        }
\ No newline at end of file
+            'body': to_json({'error': f'Ошибка сервера: {str(e)}'})
+        }
+    
+    finally:
+        if conn is not None:
+            release_db_connection(conn)
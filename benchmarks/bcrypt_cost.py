@@ -0,0 +1,64 @@
+"""
+Login throughput against bcrypt cost factor.
+
+Simulates a class logging in at once: for every cost factor, `--logins`
+password checks are submitted concurrently through the auth function's
+bounded bcrypt pool. Reports logins/sec, latency percentiles and how many
+attempts were rejected because the queue was full.
+
+    python benchmarks/bcrypt_cost.py --costs 10 11 12 13 --logins 30
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import load_function, summarize
+
+def run_storm(auth, password_hash: str, logins: int) -> dict:
+    latencies = []
+    rejected = 0
+
+    def attempt(_):
+        started = time.perf_counter()
+        try:
+            auth.check_password('correct horse battery staple', password_hash)
+        except auth.HashingOverloaded:
+            return None
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=logins) as clients:
+        for latency in clients.map(attempt, range(logins)):
+            if latency is None:
+                rejected += 1
+            else:
+                latencies.append(latency)
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies)
+    result['rejected'] = rejected
+    result['logins_per_sec'] = round(len(latencies) / elapsed, 2) if elapsed else 0.0
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--costs', type=int, nargs='+', default=[10, 11, 12, 13])
+    parser.add_argument('--logins', type=int, default=30)
+    args = parser.parse_args()
+
+    auth = load_function('auth')
+    report = {'workers': auth.BCRYPT_WORKERS, 'queue_limit': auth.BCRYPT_QUEUE_LIMIT, 'results': []}
+
+    for cost in args.costs:
+        auth.BCRYPT_ROUNDS = cost
+        password_hash = auth.hash_password('correct horse battery staple')
+        result = run_storm(auth, password_hash, args.logins)
+        result['cost'] = cost
+        report['results'].append(result)
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
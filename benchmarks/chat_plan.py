@@ -0,0 +1,74 @@
+"""
+Plan check for the chat history queries.
+
+Runs EXPLAIN on every page shape the chat function builds (latest page,
+scroll-back, delta by id, archive page) and fails unless Postgres answers
+it with range scans of the conversation-key index: no BitmapOr, no Sort.
+chat_messages is partitioned by month, so the live table is read through
+the per-partition copies of idx_chat_conversation under a Merge Append.
+
+    DATABASE_URL=postgres://... python benchmarks/chat_plan.py --user 1 --other 2
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, List
+
+from common import load_function
+
+HISTORY_INDEXES = ('idx_chat_conversation', 'idx_chat_archive_conversation')
+PARTITION_INDEX_SUFFIX = '_conversation_key_id_idx'
+FORBIDDEN_NODES = {'BitmapOr', 'Sort', 'Incremental Sort'}
+
+def walk(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk(child)
+
+def check_plan(plan: Dict[str, Any]) -> List[str]:
+    nodes = list(walk(plan))
+    problems = [f"unexpected {node['Node Type']} node" for node in nodes if node['Node Type'] in FORBIDDEN_NODES]
+    index_names = [node.get('Index Name', '') for node in nodes if node['Node Type'] == 'Index Scan']
+    if not any(name in HISTORY_INDEXES or name.endswith(PARTITION_INDEX_SUFFIX) for name in index_names):
+        problems.append('conversation-key index is not used for an index scan')
+    return problems
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user', type=int, default=1)
+    parser.add_argument('--other', type=int, default=2)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    chat = load_function('chat')
+    key = chat.conversation_key(args.user, args.other)
+    cases = {}
+    for name, (since_id, since_ts, before_id) in {
+        'latest': (None, None, None),
+        'before_id': (None, None, 1000),
+        'since_id': (1000, None, None)
+    }.items():
+        query, params, _ = chat.build_history_query(key, since_id, since_ts, before_id, args.limit)
+        cases[name] = (query, params)
+    cases['archive'] = chat.build_archive_query(key, 1000, args.limit)
+
+    conn = chat.get_db_connection()
+    failed = False
+    try:
+        cursor = conn.cursor()
+        # A small development table is cheaper to read sequentially; plan as for a large one
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, (query, params) in cases.items():
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + query, params)
+            plan = cursor.fetchone()['QUERY PLAN'][0]['Plan']
+            problems = check_plan(plan)
+            failed = failed or bool(problems)
+            print(json.dumps({'case': name, 'ok': not problems, 'problems': problems}))
+    finally:
+        chat.release_db_connection(conn)
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
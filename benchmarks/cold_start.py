@@ -0,0 +1,123 @@
+"""
+Cold-start cost of each cloud function.
+
+Every run starts a fresh interpreter, imports backend/<name>/index.py and
+sends one GET without X-Auth-Token through the handler. Most functions answer
+it with 401 before touching the database; auth opens its database connection
+first, so without DATABASE_URL its probe ends in a 500 and only the import
+time is meaningful. Reports the median import time, first-request latency and
+peak RSS per function, and which heavy modules were loaded. Exits non-zero
+when a function's median import time exceeds --budget-ms.
+
+materials imports boto3 on first use, so that cost moves from import to the
+first request that builds the S3 client. When DATABASE_URL points at a seeded
+database (load.py --seed), materials is also probed with two authenticated
+first requests for the same material in fresh interpreters: the detail view,
+which only reads the database, and action=download_url, which builds the S3
+client and presigns a URL. Presigning is local, so placeholder AWS keys are
+enough when no S3 stand-in is configured.
+
+    python benchmarks/cold_start.py --runs 5 --budget-ms 250
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+from common import FUNCTIONS, load_function
+from load import make_event
+from seed import load_fixture
+
+HEAVY_MODULES = ['boto3', 'botocore', 'bcrypt', 'psycopg2', 'jwt']
+
+CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+from common import load_function
+started = time.perf_counter()
+module = load_function(sys.argv[2])
+imported = time.perf_counter()
+response = module.handler(json.loads(sys.argv[3]), None)
+finished = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (finished - imported) * 1000,
+    'status': response['statusCode'],
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'loaded': [name for name in json.loads(sys.argv[4]) if name in sys.modules]
+}))
+"""
+
+def measure(name: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    env = dict(os.environ, TIMING_LOG='0')
+    env.setdefault('AWS_ACCESS_KEY_ID', 'cold-start')
+    env.setdefault('AWS_SECRET_ACCESS_KEY', 'cold-start')
+    completed = subprocess.run(
+        [sys.executable, '-c', CHILD, os.path.dirname(os.path.abspath(__file__)), name,
+         json.dumps(event), json.dumps(HEAVY_MODULES)],
+        capture_output=True, text=True, env=env, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def aggregate(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        'import_ms': round(statistics.median(run['import_ms'] for run in runs), 2),
+        'first_request_ms': round(statistics.median(run['first_request_ms'] for run in runs), 2),
+        'max_rss_mb': round(max(run['max_rss_mb'] for run in runs), 1),
+        'status': runs[-1]['status'],
+        'loaded': runs[-1]['loaded']
+    }
+
+def s3_probe_events() -> Optional[Dict[str, Dict[str, Any]]]:
+    if not os.environ.get('DATABASE_URL'):
+        return None
+
+    auth = load_function('auth')
+    conn = auth.get_db_connection()
+    try:
+        fixture = load_fixture(conn)
+    finally:
+        auth.release_db_connection(conn)
+    if not fixture['material_id']:
+        return None
+
+    token = auth.generate_token(fixture['teacher'])
+    return {
+        'db_only': make_event('GET', token, {'material_id': fixture['material_id']}),
+        'with_s3_client': make_event('GET', token, {'action': 'download_url', 'material_id': fixture['material_id']})
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=250.0, help='maximum median import time per function')
+    parser.add_argument('--only', nargs='+', choices=FUNCTIONS)
+    args = parser.parse_args()
+
+    unauthenticated = make_event('GET')
+    over_budget = []
+    for name in args.only or FUNCTIONS:
+        result = {'function': name, **aggregate([measure(name, unauthenticated) for _ in range(args.runs)])}
+        if result['import_ms'] > args.budget_ms:
+            over_budget.append(name)
+        print(json.dumps(result))
+
+    if not args.only or 'materials' in args.only:
+        events = s3_probe_events()
+        if events is None:
+            print('materials S3 probe skipped: needs DATABASE_URL with the load.py --seed data set', file=sys.stderr)
+        else:
+            for probe, event in events.items():
+                result = aggregate([measure('materials', event) for _ in range(args.runs)])
+                print(json.dumps({'function': 'materials', 'probe': probe, **result}))
+
+    if over_budget:
+        print(f"import time over {args.budget_ms} ms: {', '.join(over_budget)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Helpers shared by the benchmark scripts: loading cloud functions from
+backend/<name>/index.py and summarising latency samples.
+"""
+
+import importlib.util
+import os
+import statistics
+import sys
+from types import ModuleType
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS = ['auth', 'chat', 'materials', 'progress', 'teacher']
+
+def load_function(name: str) -> ModuleType:
+    module_name = f'backend_{name}'
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    path = os.path.join(ROOT, 'backend', name, 'index.py')
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 2) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p95_ms': round(percentile(samples, 95) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2)
+    }
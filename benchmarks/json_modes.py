@@ -0,0 +1,144 @@
+"""
+Row mode against json_agg passthrough mode on large lists.
+
+Seeds one teacher with --rows students, materials and chat messages, then
+requests the teacher roster, the materials list and the chat history with
+page limits raised to --rows, once with JSON_PASSTHROUGH off and once on.
+Reports latency percentiles, body size and the peak Python allocation of a
+single request for each mode, and checks that both modes return the same
+payload.
+
+    DATABASE_URL=postgres://... python benchmarks/json_modes.py --rows 10000
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Dict
+
+import bcrypt
+
+from common import load_function, summarize
+from load import make_event
+from seed import PASSWORD
+
+TEACHER_EMAIL = 'json-modes-teacher@bench.local'
+TIMESTAMP = re.compile(r'^\d{4}-\d{2}-\d{2}T')
+
+def normalize(value: Any) -> Any:
+    # Postgres drops trailing zeros from fractional seconds, Python's isoformat does not
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    if isinstance(value, str) and TIMESTAMP.match(value):
+        return datetime.fromisoformat(value)
+    return value
+
+def seed_lists(conn, rows: int) -> Dict[str, Any]:
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, email, role, class_name, token_version FROM users WHERE email = %s", (TEACHER_EMAIL,))
+    teacher = cursor.fetchone()
+    if teacher:
+        conn.rollback()
+        return dict(teacher)
+
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(4)).decode('utf-8')
+    cursor.execute("""
+        INSERT INTO users (email, password_hash, full_name, role)
+        VALUES (%s, %s, 'Преподаватель JSON', 'teacher')
+        RETURNING id, email, role, class_name, token_version
+    """, (TEACHER_EMAIL, password_hash))
+    teacher = dict(cursor.fetchone())
+    cursor.execute("""
+        WITH students AS (
+            INSERT INTO users (email, password_hash, full_name, role, class_name)
+            SELECT 'json-modes-student' || g || '@bench.local', %s, 'Ученик ' || g, 'student', '10А'
+            FROM generate_series(1, %s) g
+            RETURNING id
+        ),
+        progress AS (
+            INSERT INTO user_progress (user_id, tests_completed, score_sum)
+            SELECT id, 10, 10 * (id %% 100) FROM students
+        )
+        INSERT INTO teacher_students (teacher_id, student_id)
+        SELECT %s, id FROM students
+    """, (password_hash, rows, teacher['id']))
+    cursor.execute("""
+        INSERT INTO learning_materials (teacher_id, title, description, content, file_url, file_type, file_size, category, created_at)
+        SELECT %s, 'Материал ' || g, 'Описание ' || g, repeat('Текст. ', 50), '', 'text/plain', 350, 'Общее',
+               CURRENT_TIMESTAMP - g * INTERVAL '1 minute'
+        FROM generate_series(1, %s) g
+    """, (teacher['id'], rows))
+    cursor.execute("""
+        INSERT INTO chat_messages (sender_id, receiver_id, message, is_read, created_at)
+        SELECT %s, %s, 'Сообщение ' || g, TRUE, CURRENT_TIMESTAMP - (%s - g) * INTERVAL '1 second'
+        FROM generate_series(1, %s) g
+    """, (teacher['id'], teacher['id'], rows, rows))
+    cursor.execute('ANALYZE')
+    conn.commit()
+    return teacher
+
+def measure(module, event: Dict[str, Any], requests: int) -> Dict[str, Any]:
+    context = SimpleNamespace(request_id='bench', function_name=module.__name__)
+    module.handler(event, context)
+
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = module.handler(event, context)
+        latencies.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    module.handler(event, context)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = summarize(latencies)
+    result['body_kb'] = round(len(response['body'].encode('utf-8')) / 1024, 1)
+    result['peak_alloc_kb'] = round(peak / 1024, 1)
+    result['payload'] = json.loads(response['body'])
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault('TIMING_LOG', '0')
+    auth = load_function('auth')
+    conn = auth.get_db_connection()
+    try:
+        teacher = seed_lists(conn, args.rows)
+    finally:
+        auth.release_db_connection(conn)
+    token = auth.generate_token(teacher)
+
+    chat = load_function('chat')
+    materials = load_function('materials')
+    teacher_function = load_function('teacher')
+    chat.CHAT_PAGE_SIZE_MAX = args.rows
+    materials.MATERIALS_PAGE_SIZE_MAX = args.rows
+
+    cases = [
+        ('teacher.roster', teacher_function, make_event('GET', token)),
+        ('materials.list', materials, make_event('GET', token, {'limit': args.rows})),
+        ('chat.history', chat, make_event('GET', token, {'other_user_id': teacher['id'], 'limit': args.rows}))
+    ]
+
+    for name, module, event in cases:
+        results = {}
+        for mode in (False, True):
+            module.JSON_PASSTHROUGH = mode
+            results['json_agg' if mode else 'rows'] = measure(module, event, args.requests)
+        same_payload = normalize(results['rows'].pop('payload')) == normalize(results['json_agg'].pop('payload'))
+        print(json.dumps({'case': name, 'rows': args.rows, 'same_payload': same_payload, **results}))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Load harness for the five cloud functions.
+
+Calls every function's handler(event, context) in-process against a local
+Postgres (DATABASE_URL) and a local S3 stand-in such as MinIO
+(S3_ENDPOINT_URL, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY). For each
+action it reports latency percentiles, requests/sec and the number of SQL
+statements a request issues, read from the Server-Timing header every
+function attaches to its responses. With --baseline it exits non-zero when
+p95 grows beyond the tolerance or an action starts issuing more queries.
+
+    python benchmarks/load.py --migrate --seed --students 3000
+    python benchmarks/load.py --requests 200 --save-baseline benchmarks/baseline.json
+    python benchmarks/load.py --requests 200 --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import base64
+import json
+import os
+import re
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from common import FUNCTIONS, load_function, summarize
+from seed import PASSWORD, apply_migrations, load_fixture, seed
+
+QUERY_COUNT = re.compile(r'db;dur=[0-9.]+;desc="(\d+) queries"')
+
+def query_count(response: Dict[str, Any]) -> int:
+    match = QUERY_COUNT.search((response.get('headers') or {}).get('Server-Timing', ''))
+    return int(match.group(1)) if match else 0
+
+def make_event(method: str, token: Optional[str] = None, params: Optional[Dict[str, Any]] = None,
+               body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {
+        'httpMethod': method,
+        'headers': {'X-Auth-Token': token} if token else {},
+        'queryStringParameters': {key: str(value) for key, value in (params or {}).items()},
+        'body': json.dumps(body) if body is not None else '',
+        'isBase64Encoded': False
+    }
+
+def build_scenarios(fixture: Dict[str, Any], tokens: Dict[str, str], with_s3: bool) -> List[Tuple[str, str, Callable[[int], Dict[str, Any]]]]:
+    teacher, student = fixture['teacher'], fixture['student']
+    teacher_token, student_token = tokens['teacher'], tokens['student']
+    middle_id = (fixture['chat_first_id'] + fixture['chat_last_id']) // 2 if fixture['chat_last_id'] else 1
+    roster = fixture['roster'][:200]
+    material_id = fixture['material_id']
+
+    scenarios = [
+        ('auth', 'login', lambda i: make_event('POST', body={'action': 'login', 'email': student['email'], 'password': PASSWORD})),
+        ('auth', 'profile', lambda i: make_event('GET', student_token)),
+        ('chat', 'history_latest', lambda i: make_event('GET', student_token, {'other_user_id': teacher['id']})),
+        ('chat', 'history_before', lambda i: make_event('GET', student_token, {'other_user_id': teacher['id'], 'before_id': middle_id})),
+        ('chat', 'history_delta', lambda i: make_event('GET', student_token, {'other_user_id': teacher['id'], 'since_id': fixture['chat_last_id'] or 0})),
+        ('chat', 'send', lambda i: make_event('POST', teacher_token, body={'action': 'send', 'receiver_id': student['id'], 'message': f'Нагрузочное сообщение {i}'})),
+        ('chat', 'ack', lambda i: make_event('POST', student_token, body={'action': 'ack', 'other_user_id': teacher['id'], 'up_to_id': 2 ** 31 - 1})),
+        ('chat', 'unread_count', lambda i: make_event('POST', student_token, body={'action': 'unread_count'})),
+        ('chat', 'inbox', lambda i: make_event('POST', teacher_token, body={'action': 'inbox'})),
+        ('materials', 'list_summary', lambda i: make_event('GET', student_token, {'view': 'summary'})),
+        ('materials', 'list_full', lambda i: make_event('GET', teacher_token)),
+        ('materials', 'detail', lambda i: make_event('GET', student_token, {'material_id': material_id})),
+        ('progress', 'get', lambda i: make_event('GET', student_token)),
+        ('progress', 'get_teachers', lambda i: make_event('GET', student_token, {'action': 'get_teachers'})),
+        ('progress', 'save_test_result', lambda i: make_event('POST', student_token, body={
+            'action': 'save_test_result', 'topic': f'Тема {i % 20}', 'score': i % 101, 'total_questions': 10, 'correct_answers': i % 11
+        })),
+        ('progress', 'mark_lecture_viewed', lambda i: make_event('POST', student_token, body={
+            'action': 'mark_lecture_viewed', 'title': f'Лекция {i % 20}', 'duration': '45 мин'
+        })),
+        ('teacher', 'roster', lambda i: make_event('GET', teacher_token)),
+        ('teacher', 'student_detail', lambda i: make_event('GET', teacher_token, {'student_id': student['id']})),
+        ('teacher', 'status_matrix', lambda i: make_event('POST', teacher_token, body={'action': 'get_status_matrix'})),
+        ('teacher', 'update_statuses', lambda i: make_event('POST', teacher_token, body={
+            'action': 'update_material_statuses',
+            'updates': [
+                {'material_id': material_id, 'student_id': student_id, 'status': ['in_progress', 'completed'][i % 2]}
+                for student_id in roster
+            ]
+        }))
+    ]
+    if with_s3:
+        payload = base64.b64encode(os.urandom(256 * 1024)).decode('ascii')
+        scenarios += [
+            ('materials', 'presign_upload', lambda i: make_event('POST', teacher_token, body={
+                'action': 'presign_upload', 'title': f'Файл {i}', 'file_name': 'lesson.pdf', 'file_type': 'application/pdf'
+            })),
+            ('materials', 'upload_256k', lambda i: make_event('POST', teacher_token, body={
+                'action': 'upload', 'title': f'Файл {i}', 'file_name': 'lesson.pdf', 'file_type': 'application/pdf', 'file_base64': payload
+            }))
+        ]
+    return scenarios
+
+def run_scenario(module, build_event: Callable[[int], Dict[str, Any]], requests: int, warmup: int) -> Dict[str, Any]:
+    context = SimpleNamespace(request_id='bench', function_name=module.__name__)
+    for i in range(warmup):
+        module.handler(build_event(i), context)
+
+    latencies = []
+    queries = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(requests):
+        event = build_event(warmup + i)
+        request_started = time.perf_counter()
+        response = module.handler(event, context)
+        latencies.append(time.perf_counter() - request_started)
+        queries.append(query_count(response))
+        if response['statusCode'] >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies)
+    result['requests_per_sec'] = round(requests / elapsed, 2) if elapsed else 0.0
+    result['queries_per_request'] = round(sum(queries) / len(queries), 2) if queries else 0.0
+    result['errors'] = errors
+    return result
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if result['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {result['p95_ms']} ms")
+        if result['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(f"{name}: queries/request {previous['queries_per_request']} -> {result['queries_per_request']}")
+        if result['errors'] > previous.get('errors', 0):
+            regressions.append(f"{name}: errors {previous.get('errors', 0)} -> {result['errors']}")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--migrate', action='store_true', help='apply db_migrations to an empty database first')
+    parser.add_argument('--seed', action='store_true', help='insert the benchmark data set')
+    parser.add_argument('--students', type=int, default=3000)
+    parser.add_argument('--teachers', type=int, default=30)
+    parser.add_argument('--materials', type=int, default=40, help='materials per teacher')
+    parser.add_argument('--tests', type=int, default=30, help='test results per student')
+    parser.add_argument('--topics', type=int, default=60, help='completed topics per student')
+    parser.add_argument('--chat-messages', type=int, default=20000, help='messages in the long conversation')
+    parser.add_argument('--requests', type=int, default=100, help='measured requests per action')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--only', nargs='+', choices=FUNCTIONS, help='benchmark only these functions')
+    parser.add_argument('--baseline', help='fail on regressions against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 growth over the baseline')
+    parser.add_argument('--save-baseline', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    # One JSON timing line per request would drown the report
+    os.environ.setdefault('TIMING_LOG', '0')
+    modules = {name: load_function(name) for name in FUNCTIONS}
+
+    if args.migrate or args.seed:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'], cursor_factory=RealDictCursor)
+        try:
+            if args.migrate:
+                apply_migrations(conn, modules['auth'].DB_SCHEMA)
+            conn.cursor().execute(f"SET search_path TO {modules['auth'].DB_SCHEMA}, public")
+            if args.seed:
+                seed(conn, args.students, args.teachers, args.materials, args.tests, args.topics,
+                     args.chat_messages, modules['auth'].BCRYPT_ROUNDS)
+        finally:
+            conn.close()
+
+    conn = modules['auth'].get_db_connection()
+    try:
+        fixture = load_fixture(conn)
+    finally:
+        modules['auth'].release_db_connection(conn)
+
+    tokens = {role: modules['auth'].generate_token(fixture[role]) for role in ('teacher', 'student')}
+    with_s3 = bool(os.environ.get('S3_ENDPOINT_URL') and os.environ.get('AWS_ACCESS_KEY_ID'))
+
+    results = {}
+    for function, action, build_event in build_scenarios(fixture, tokens, with_s3):
+        if args.only and function not in args.only:
+            continue
+        name = f'{function}.{action}'
+        results[name] = run_scenario(modules[function], build_event, args.requests, args.warmup)
+        print(json.dumps({'action': name, **results[name]}, ensure_ascii=False))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(results, baseline_file, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
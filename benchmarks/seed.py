@@ -0,0 +1,222 @@
+"""
+Data set for the load harness: applies db_migrations to an empty local
+Postgres and fills it with a school-sized volume of users, progress,
+materials, statuses and chat history.
+
+Run directly, it is a smoke test of the seeder itself: migrations and a tiny
+data set go into a throwaway schema, the fixture is read back and the schema
+is dropped again.
+
+    DATABASE_URL=postgres://... python benchmarks/seed.py
+"""
+
+import argparse
+import glob
+import json
+import os
+from typing import Any, Dict
+
+import bcrypt
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from common import ROOT
+
+PASSWORD = 'bench-password-123'
+# Some migrations name the production schema explicitly; replays into another schema retarget them
+PRODUCTION_SCHEMA = 't_p91447108_ai_improvement_websi'
+CLASS_NAMES = ['9А', '9Б', '10А', '10Б', '11А']
+MATERIAL_STATUSES = ['not_started', 'in_progress', 'completed', 'needs_review']
+
+def apply_migrations(conn, schema: str) -> None:
+    cursor = conn.cursor()
+    cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {schema}')
+    cursor.execute(f'SET search_path TO {schema}, public')
+    for path in sorted(glob.glob(os.path.join(ROOT, 'db_migrations', 'V*.sql'))):
+        with open(path, encoding='utf-8') as migration:
+            cursor.execute(migration.read().replace(f'{PRODUCTION_SCHEMA}.', f'{schema}.'))
+    conn.commit()
+
+def seed(conn, students: int, teachers: int, materials: int, tests_per_student: int,
+         topics_per_student: int, chat_messages: int, bcrypt_rounds: int) -> None:
+    cursor = conn.cursor()
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(bcrypt_rounds)).decode('utf-8')
+
+    cursor.execute("""
+        INSERT INTO users (email, password_hash, full_name, role)
+        SELECT 'teacher' || g || '@bench.local', %s, 'Преподаватель ' || g, 'teacher'
+        FROM generate_series(1, %s) g
+    """, (password_hash, teachers))
+    cursor.execute("""
+        INSERT INTO users (email, password_hash, full_name, role, class_name)
+        SELECT 'student' || g || '@bench.local', %s, 'Ученик ' || g, 'student',
+               (%s::text[])[1 + g %% %s]
+        FROM generate_series(1, %s) g
+    """, (password_hash, CLASS_NAMES, len(CLASS_NAMES), students))
+
+    # Ученики распределяются по преподавателям по кругу
+    cursor.execute("""
+        WITH t AS (
+            SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS n FROM users WHERE role = 'teacher'
+        ),
+        s AS (
+            SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS n FROM users WHERE role = 'student'
+        )
+        INSERT INTO teacher_students (teacher_id, student_id)
+        SELECT t.id, s.id FROM s JOIN t ON t.n = s.n %% %s
+    """, (teachers,))
+
+    cursor.execute("""
+        INSERT INTO test_results (user_id, topic, score, total_questions, correct_answers, created_at)
+        SELECT u.id, 'Тема ' || t, (u.id * 7 + t * 13) %% 101, 10, ((u.id * 7 + t * 13) %% 101) / 10,
+               CURRENT_TIMESTAMP - t * INTERVAL '1 day'
+        FROM users u CROSS JOIN generate_series(1, %s) t
+        WHERE u.role = 'student'
+    """, (tests_per_student,))
+    cursor.execute("""
+        INSERT INTO user_progress (user_id, completed_topics, tests_completed, score_sum, last_activity)
+        SELECT u.id,
+               (SELECT jsonb_agg('Тема ' || t) FROM generate_series(1, %s) t),
+               COALESCE(agg.tests_completed, 0),
+               COALESCE(agg.score_sum, 0),
+               CURRENT_TIMESTAMP
+        FROM users u
+        LEFT JOIN (
+            SELECT user_id, COUNT(*) AS tests_completed, SUM(score) AS score_sum
+            FROM test_results GROUP BY user_id
+        ) agg ON agg.user_id = u.id
+        WHERE u.role = 'student'
+        ON CONFLICT (user_id) DO NOTHING
+    """, (topics_per_student,))
+    cursor.execute("""
+        INSERT INTO lecture_views (user_id, lecture_title, duration)
+        SELECT u.id, 'Лекция ' || l, '45 мин'
+        FROM users u CROSS JOIN generate_series(1, %s) l
+        WHERE u.role = 'student'
+    """, (max(1, topics_per_student // 2),))
+
+    cursor.execute("""
+        INSERT INTO learning_materials (teacher_id, title, description, content, file_url, file_type, file_size, category, created_at)
+        SELECT t.id, 'Материал ' || m, 'Описание материала ' || m, repeat('Текст лекции. ', 400),
+               'https://cdn.poehali.dev/projects/bench/bucket/materials/' || t.id || '-' || m || '.pdf',
+               'application/pdf', 5600, (ARRAY['Общее', 'Алгебра', 'Геометрия'])[1 + m %% 3],
+               CURRENT_TIMESTAMP - m * INTERVAL '1 hour'
+        FROM users t CROSS JOIN generate_series(1, %s) m
+        WHERE t.role = 'teacher'
+    """, (materials,))
+    cursor.execute("""
+        INSERT INTO material_status (material_id, student_id, status)
+        SELECT lm.id, ts.student_id, (%s::text[])[1 + (lm.id + ts.student_id) %% 4]
+        FROM learning_materials lm
+        JOIN teacher_students ts ON ts.teacher_id = lm.teacher_id
+        WHERE (lm.id + ts.student_id) %% 3 = 0
+    """, (MATERIAL_STATUSES,))
+
+    # Одна длинная переписка первого преподавателя с первым учеником и короткие у остальных
+    cursor.execute("""
+        WITH pair AS (
+            SELECT ts.teacher_id, ts.student_id
+            FROM teacher_students ts
+            ORDER BY ts.teacher_id, ts.student_id
+            LIMIT 1
+        )
+        INSERT INTO chat_messages (sender_id, receiver_id, message, is_read, created_at)
+        SELECT CASE WHEN g %% 2 = 0 THEN teacher_id ELSE student_id END,
+               CASE WHEN g %% 2 = 0 THEN student_id ELSE teacher_id END,
+               'Сообщение ' || g, g <= %s - 10, CURRENT_TIMESTAMP - (%s - g) * INTERVAL '1 second'
+        FROM pair CROSS JOIN generate_series(1, %s) g
+    """, (chat_messages, chat_messages, chat_messages))
+    cursor.execute("""
+        INSERT INTO chat_messages (sender_id, receiver_id, message, is_read, created_at)
+        SELECT CASE WHEN g % 2 = 0 THEN ts.teacher_id ELSE ts.student_id END,
+               CASE WHEN g % 2 = 0 THEN ts.student_id ELSE ts.teacher_id END,
+               'Вопрос по теме ' || g, TRUE, CURRENT_TIMESTAMP - g * INTERVAL '1 minute'
+        FROM teacher_students ts CROSS JOIN generate_series(1, 4) g
+    """)
+    cursor.execute("""
+        INSERT INTO chat_conversations (user_id, other_user_id, unread_count, last_message_id, last_message, last_sender_id, last_message_at)
+        SELECT p.user_id, p.other_user_id, p.unread_count, m.id, LEFT(m.message, 200), m.sender_id, m.created_at
+        FROM (
+            SELECT user_id, other_user_id, COUNT(*) FILTER (WHERE unread) AS unread_count, MAX(id) AS last_message_id
+            FROM (
+                SELECT receiver_id AS user_id, sender_id AS other_user_id, id, NOT is_read AS unread FROM chat_messages
+                UNION ALL
+                SELECT sender_id, receiver_id, id, FALSE FROM chat_messages
+            ) directions
+            GROUP BY user_id, other_user_id
+        ) p
+        JOIN chat_messages m ON m.id = p.last_message_id
+    """)
+
+    cursor.execute('ANALYZE')
+    conn.commit()
+
+def load_fixture(conn) -> Dict[str, Any]:
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT ts.teacher_id, ts.student_id
+        FROM teacher_students ts
+        ORDER BY ts.teacher_id, ts.student_id
+        LIMIT 1
+    """)
+    pair = cursor.fetchone()
+    if not pair:
+        raise RuntimeError('База пуста: запустите с --seed')
+
+    cursor.execute("""
+        SELECT id, email, role, class_name, token_version
+        FROM users WHERE id IN (%s, %s)
+    """, (pair['teacher_id'], pair['student_id']))
+    users = {row['id']: dict(row) for row in cursor.fetchall()}
+
+    cursor.execute("""
+        SELECT MIN(id) AS first_id, MAX(id) AS last_id
+        FROM chat_messages
+        WHERE conversation_key = ((LEAST(%s, %s)::bigint << 32) | GREATEST(%s, %s)::bigint)
+    """, (pair['teacher_id'], pair['student_id'], pair['teacher_id'], pair['student_id']))
+    chat = cursor.fetchone()
+
+    cursor.execute("""
+        SELECT id FROM learning_materials WHERE teacher_id = %s ORDER BY id LIMIT 1
+    """, (pair['teacher_id'],))
+    material = cursor.fetchone()
+
+    cursor.execute("""
+        SELECT array_agg(student_id ORDER BY student_id) AS student_ids
+        FROM teacher_students WHERE teacher_id = %s
+    """, (pair['teacher_id'],))
+    roster = cursor.fetchone()
+    conn.rollback()
+
+    return {
+        'teacher': users[pair['teacher_id']],
+        'student': users[pair['student_id']],
+        'roster': roster['student_ids'] or [],
+        'chat_first_id': chat['first_id'],
+        'chat_last_id': chat['last_id'],
+        'material_id': material['id'] if material else None
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--schema', default='bench_seed_smoke')
+    parser.add_argument('--keep', action='store_true', help='leave the schema in place afterwards')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'], cursor_factory=RealDictCursor)
+    try:
+        conn.cursor().execute(f'DROP SCHEMA IF EXISTS {args.schema} CASCADE')
+        apply_migrations(conn, args.schema)
+        seed(conn, students=20, teachers=2, materials=3, tests_per_student=3,
+             topics_per_student=3, chat_messages=50, bcrypt_rounds=4)
+        fixture = load_fixture(conn)
+        print(json.dumps(fixture, default=str, ensure_ascii=False))
+    finally:
+        if not args.keep:
+            conn.rollback()
+            conn.cursor().execute(f'DROP SCHEMA IF EXISTS {args.schema} CASCADE')
+            conn.commit()
+        conn.close()
+
+if __name__ == '__main__':
+    main()
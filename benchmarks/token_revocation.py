@@ -0,0 +1,106 @@
+"""
+Revocation check for the token_version claim.
+
+Registers a throwaway student against DATABASE_URL and checks that a token
+issued before a bump of users.token_version is answered with 401. Two bumps
+are exercised: change_password, and a role change made directly in SQL,
+which the V0021 trigger turns into a bump. The user is deleted afterwards.
+Exits non-zero when any step fails.
+
+auth reads the version on every request, so it rejects the old token at
+once. The other functions cache a user's version for TOKEN_VERSION_TTL
+seconds (60 by default) per warm instance, so an instance that served the
+old token keeps accepting it until that entry expires. The check asserts
+both sides of that window, with the TTL shortened to --ttl seconds.
+
+    DATABASE_URL=postgres://... python benchmarks/token_revocation.py
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from common import load_function
+from load import make_event
+
+OLD_PASSWORD = 'revocation-old-123'
+NEW_PASSWORD = 'revocation-new-456'
+
+def call(module, event: Dict[str, Any]) -> Dict[str, Any]:
+    response = module.handler(event, None)
+    body = json.loads(response['body']) if response.get('body') else {}
+    return {'status': response['statusCode'], 'body': body}
+
+def expect(results: List[Dict[str, Any]], step: str, response: Dict[str, Any], status: int) -> None:
+    results.append({'step': step, 'ok': response['status'] == status, 'expected': status, 'status': response['status']})
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ttl', type=float, default=5.0, help='TOKEN_VERSION_TTL used for progress during the check')
+    args = parser.parse_args()
+
+    os.environ.setdefault('TIMING_LOG', '0')
+    auth = load_function('auth')
+    progress = load_function('progress')
+    progress.TOKEN_VERSION_TTL = args.ttl
+    email = f'revocation-{uuid.uuid4().hex[:12]}@bench.local'
+    results: List[Dict[str, Any]] = []
+    user_id: Optional[int] = None
+
+    try:
+        registered = call(auth, make_event('POST', body={
+            'action': 'register', 'email': email, 'password': OLD_PASSWORD, 'full_name': 'Проверка отзыва'
+        }))
+        expect(results, 'register', registered, 201)
+        user_id = registered['body']['user']['id']
+        old_token = registered['body']['token']
+
+        # Warm progress' per-process version cache with the old token
+        warmed_at = time.monotonic()
+        expect(results, 'progress accepts the old token', call(progress, make_event('GET', old_token)), 200)
+
+        changed = call(auth, make_event('POST', old_token, body={
+            'action': 'change_password', 'current_password': OLD_PASSWORD, 'new_password': NEW_PASSWORD
+        }))
+        expect(results, 'change_password', changed, 200)
+        new_token = changed['body'].get('token')
+
+        expect(results, 'auth rejects the old token', call(auth, make_event('GET', old_token)), 401)
+        expect(results, 'auth accepts the new token', call(auth, make_event('GET', new_token)), 200)
+        expect(results, 'warm progress still accepts the old token inside the TTL window',
+               call(progress, make_event('GET', old_token)), 200)
+        time.sleep(max(0.0, args.ttl - (time.monotonic() - warmed_at)) + 0.1)
+        expect(results, 'progress rejects the old token once the TTL expires', call(progress, make_event('GET', old_token)), 401)
+        expect(results, 'progress accepts the new token', call(progress, make_event('GET', new_token)), 200)
+        expect(results, 'login with the old password fails', call(auth, make_event('POST', body={
+            'action': 'login', 'email': email, 'password': OLD_PASSWORD
+        })), 401)
+
+        conn = auth.get_db_connection()
+        try:
+            conn.cursor().execute("UPDATE users SET role = 'teacher' WHERE id = %s", (user_id,))
+            conn.commit()
+        finally:
+            auth.release_db_connection(conn)
+        expect(results, 'auth rejects the token after a role change', call(auth, make_event('GET', new_token)), 401)
+    finally:
+        if user_id is not None:
+            conn = auth.get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM user_progress WHERE user_id = %s', (user_id,))
+                cursor.execute('DELETE FROM users WHERE id = %s', (user_id,))
+                conn.commit()
+            finally:
+                auth.release_db_connection(conn)
+
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    sys.exit(0 if results and all(result['ok'] for result in results) else 1)
+
+if __name__ == '__main__':
+    main()
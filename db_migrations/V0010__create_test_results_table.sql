@@ -0,0 +1,43 @@
+-- Результаты тестов хранятся построчно вместо JSONB-массива user_progress.test_results
+CREATE TABLE IF NOT EXISTS test_results (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    topic VARCHAR(255) NOT NULL,
+    score INTEGER NOT NULL DEFAULT 0,
+    total_questions INTEGER NOT NULL DEFAULT 0,
+    correct_answers INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_test_results_user ON test_results(user_id, id);
+
+-- Агрегаты, обновляемые при каждой вставке результата
+ALTER TABLE user_progress ADD COLUMN IF NOT EXISTS tests_completed INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE user_progress ADD COLUMN IF NOT EXISTS score_sum BIGINT NOT NULL DEFAULT 0;
+
+-- Перенос существующих результатов из JSONB
+INSERT INTO test_results (user_id, topic, score, total_questions, correct_answers, created_at)
+SELECT up.user_id,
+       COALESCE(r.item->>'topic', 'Тест'),
+       COALESCE(ROUND((r.item->>'score')::numeric), 0)::integer,
+       COALESCE((r.item->>'total_questions')::integer, 0),
+       COALESCE((r.item->>'correct_answers')::integer, 0),
+       COALESCE((r.item->>'date')::timestamp, up.last_activity)
+FROM user_progress up
+CROSS JOIN LATERAL jsonb_array_elements(COALESCE(up.test_results, '[]'::jsonb)) WITH ORDINALITY AS r(item, position)
+ORDER BY up.user_id, r.position;
+
+UPDATE user_progress up
+SET tests_completed = agg.tests_completed,
+    score_sum = agg.score_sum
+FROM (
+    SELECT user_id, COUNT(*) AS tests_completed, SUM(score) AS score_sum
+    FROM test_results
+    GROUP BY user_id
+) agg
+WHERE agg.user_id = up.user_id;
+
+COMMENT ON TABLE test_results IS 'Результаты прохождения тестов';
+COMMENT ON COLUMN user_progress.tests_completed IS 'Количество пройденных тестов';
+COMMENT ON COLUMN user_progress.score_sum IS 'Сумма баллов за все тесты';
+COMMENT ON COLUMN user_progress.test_results IS 'Устарело: результаты хранятся в test_results';
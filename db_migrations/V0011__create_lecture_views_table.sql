@@ -0,0 +1,24 @@
+-- Просмотренные лекции: одна строка на пару (пользователь, лекция) вместо JSONB-массива
+CREATE TABLE IF NOT EXISTS lecture_views (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    lecture_title VARCHAR(255) NOT NULL,
+    duration VARCHAR(50),
+    viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(user_id, lecture_title)
+);
+
+-- Перенос существующих просмотров; при повторах по названию берётся последний
+INSERT INTO lecture_views (user_id, lecture_title, duration, viewed_at)
+SELECT DISTINCT ON (up.user_id, COALESCE(l.item->>'title', ''))
+       up.user_id,
+       COALESCE(l.item->>'title', ''),
+       l.item->>'duration',
+       COALESCE((l.item->>'viewed_at')::timestamp, up.last_activity)
+FROM user_progress up
+CROSS JOIN LATERAL jsonb_array_elements(COALESCE(up.viewed_lectures, '[]'::jsonb)) WITH ORDINALITY AS l(item, position)
+ORDER BY up.user_id, COALESCE(l.item->>'title', ''), l.position DESC
+ON CONFLICT (user_id, lecture_title) DO NOTHING;
+
+COMMENT ON TABLE lecture_views IS 'Просмотренные пользователями лекции';
+COMMENT ON COLUMN user_progress.viewed_lectures IS 'Устарело: просмотры хранятся в lecture_views';
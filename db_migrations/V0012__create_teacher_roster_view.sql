@@ -0,0 +1,25 @@
+-- Средний балл пересчитывается Postgres при каждом обновлении агрегатов
+ALTER TABLE user_progress ADD COLUMN IF NOT EXISTS average_score DOUBLE PRECISION
+    GENERATED ALWAYS AS (
+        CASE WHEN tests_completed > 0
+            THEN ROUND(score_sum::numeric / tests_completed, 1)::double precision
+            ELSE 0
+        END
+    ) STORED;
+
+-- Сводка по ученикам для списка в кабинете преподавателя
+CREATE OR REPLACE VIEW teacher_roster AS
+SELECT ts.teacher_id,
+       u.id AS student_id,
+       u.email,
+       u.full_name,
+       u.created_at,
+       COALESCE(up.tests_completed, 0) AS tests_completed,
+       COALESCE(up.average_score, 0) AS average_score,
+       up.last_activity
+FROM teacher_students ts
+JOIN users u ON u.id = ts.student_id AND u.role = 'student'
+LEFT JOIN user_progress up ON up.user_id = u.id;
+
+COMMENT ON COLUMN user_progress.average_score IS 'Средний балл по тестам (вычисляемый столбец)';
+COMMENT ON VIEW teacher_roster IS 'Список учеников преподавателя с агрегатами прогресса';
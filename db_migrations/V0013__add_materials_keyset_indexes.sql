@@ -0,0 +1,11 @@
+-- Ключ пагинации (created_at, id) должен быть определён для каждой строки
+UPDATE learning_materials SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE learning_materials ALTER COLUMN created_at SET NOT NULL;
+
+-- Индексы под постраничную выборку материалов преподавателя с фильтрами
+CREATE INDEX IF NOT EXISTS idx_materials_teacher_created ON learning_materials(teacher_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_materials_teacher_category_created ON learning_materials(teacher_id, category, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_materials_teacher_type_created ON learning_materials(teacher_id, file_type, created_at DESC, id DESC);
+
+-- Покрываются составными индексами выше
+DROP INDEX IF EXISTS idx_materials_teacher;
@@ -0,0 +1,4 @@
+-- Версия токенов пользователя: увеличение значения отзывает все ранее выданные JWT
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN users.token_version IS 'Версия JWT; при смене роли или пароля увеличивается для отзыва токенов';
@@ -0,0 +1,6 @@
+-- Покрывающий индекс для матрицы статусов (материал × студент) и пакетных upsert-ов
+CREATE INDEX IF NOT EXISTS idx_material_status_matrix
+    ON material_status(material_id, student_id) INCLUDE (status, updated_at);
+
+-- Дублирует ведущий столбец уникального ограничения (material_id, student_id)
+DROP INDEX IF EXISTS idx_material_status_material;
@@ -0,0 +1,36 @@
+-- Сводка по диалогам: счётчик непрочитанных и последнее сообщение для каждого участника
+CREATE TABLE IF NOT EXISTS chat_conversations (
+    user_id INTEGER NOT NULL,
+    other_user_id INTEGER NOT NULL,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    last_message_id INTEGER,
+    last_message TEXT,
+    last_sender_id INTEGER,
+    last_message_at TIMESTAMP,
+    PRIMARY KEY (user_id, other_user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_conversations_recent ON chat_conversations(user_id, last_message_at DESC);
+
+-- Заполнение по существующей переписке
+INSERT INTO chat_conversations (user_id, other_user_id, unread_count, last_message_id, last_message, last_sender_id, last_message_at)
+SELECT p.user_id, p.other_user_id, p.unread_count, m.id, LEFT(m.message, 200), m.sender_id, m.created_at
+FROM (
+    SELECT user_id, other_user_id,
+           COUNT(*) FILTER (WHERE unread) AS unread_count,
+           MAX(id) AS last_message_id
+    FROM (
+        SELECT receiver_id AS user_id, sender_id AS other_user_id, id, NOT COALESCE(is_read, FALSE) AS unread
+        FROM chat_messages
+        UNION ALL
+        SELECT sender_id, receiver_id, id, FALSE
+        FROM chat_messages
+        WHERE sender_id <> receiver_id
+    ) directions
+    GROUP BY user_id, other_user_id
+) p
+JOIN chat_messages m ON m.id = p.last_message_id
+ON CONFLICT (user_id, other_user_id) DO NOTHING;
+
+COMMENT ON TABLE chat_conversations IS 'Диалоги пользователя: непрочитанные и последнее сообщение';
+COMMENT ON COLUMN chat_conversations.unread_count IS 'Количество непрочитанных входящих сообщений от other_user_id';
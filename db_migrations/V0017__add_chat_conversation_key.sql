@@ -0,0 +1,14 @@
+-- Ключ диалога не зависит от направления: (меньший id << 32) | больший id
+ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS conversation_key BIGINT
+    GENERATED ALWAYS AS (
+        (LEAST(sender_id, receiver_id)::bigint << 32) | GREATEST(sender_id, receiver_id)::bigint
+    ) STORED;
+
+-- История диалога читается одним диапазоном индекса в порядке id
+CREATE INDEX IF NOT EXISTS idx_chat_conversation ON chat_messages(conversation_key, id);
+
+-- Покрываются индексом по ключу диалога
+DROP INDEX IF EXISTS idx_chat_sender;
+DROP INDEX IF EXISTS idx_chat_receiver;
+
+COMMENT ON COLUMN chat_messages.conversation_key IS 'Ключ диалога (least, greatest) пары участников (вычисляемый столбец)';
@@ -0,0 +1,3 @@
+-- Отметка о прочтении затрагивает только непрочитанные входящие сообщения диалога
+CREATE INDEX IF NOT EXISTS idx_chat_unread ON chat_messages(conversation_key, receiver_id, id)
+    WHERE is_read = FALSE;
@@ -0,0 +1,132 @@
+-- Сообщения чата хранятся в помесячных секциях по created_at
+ALTER TABLE chat_messages RENAME TO chat_messages_legacy;
+
+CREATE TABLE chat_messages (
+    id INTEGER NOT NULL DEFAULT nextval('chat_messages_id_seq'),
+    sender_id INTEGER NOT NULL,
+    receiver_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    is_read BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    conversation_key BIGINT GENERATED ALWAYS AS (
+        (LEAST(sender_id, receiver_id)::bigint << 32) | GREATEST(sender_id, receiver_id)::bigint
+    ) STORED,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE chat_messages_id_seq OWNED BY chat_messages.id;
+
+CREATE TABLE IF NOT EXISTS chat_messages_default PARTITION OF chat_messages DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_chat_messages_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    partition_name TEXT := 'chat_messages_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF chat_messages FOR VALUES FROM (%L) TO (%L)',
+        partition_name,
+        date_trunc('month', month_start),
+        date_trunc('month', month_start) + INTERVAL '1 month'
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    month_start DATE := date_trunc('month', COALESCE((SELECT MIN(created_at) FROM chat_messages_legacy), CURRENT_TIMESTAMP));
+BEGIN
+    WHILE month_start <= date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '2 months' LOOP
+        PERFORM create_chat_messages_partition(month_start);
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+END $$;
+
+INSERT INTO chat_messages (id, sender_id, receiver_id, message, is_read, created_at)
+SELECT id, sender_id, receiver_id, message, is_read, COALESCE(created_at, CURRENT_TIMESTAMP)
+FROM chat_messages_legacy;
+
+DROP TABLE chat_messages_legacy;
+
+-- Индексы создаются на каждой секции; отбор по created_at делает секционирование
+CREATE INDEX IF NOT EXISTS idx_chat_conversation ON chat_messages(conversation_key, id);
+CREATE INDEX IF NOT EXISTS idx_chat_unread ON chat_messages(conversation_key, receiver_id, id)
+    WHERE is_read = FALSE;
+
+-- Архив старой переписки: только вставка, читается при прокрутке истории назад
+CREATE TABLE IF NOT EXISTS chat_messages_archive (
+    id INTEGER PRIMARY KEY,
+    conversation_key BIGINT NOT NULL,
+    sender_id INTEGER NOT NULL,
+    receiver_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    is_read BOOLEAN,
+    created_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_archive_conversation ON chat_messages_archive(conversation_key, id);
+
+-- Переносит в архив сообщения старше max_age и создаёт секции на два месяца вперёд.
+-- Запускается по расписанию: SELECT archive_chat_messages(INTERVAL '180 days');
+CREATE OR REPLACE FUNCTION archive_chat_messages(max_age INTERVAL DEFAULT INTERVAL '180 days') RETURNS INTEGER AS $$
+DECLARE
+    cutoff TIMESTAMP := date_trunc('month', CURRENT_TIMESTAMP - max_age);
+    archive_sql TEXT := $sql$
+        WITH moved AS (
+            INSERT INTO chat_messages_archive (id, conversation_key, sender_id, receiver_id, message, is_read, created_at)
+            SELECT id, conversation_key, sender_id, receiver_id, message, is_read, created_at
+            FROM %s
+            ON CONFLICT (id) DO NOTHING
+            RETURNING sender_id, receiver_id, is_read
+        ),
+        unread AS (
+            SELECT receiver_id, sender_id, COUNT(*) AS unread_count
+            FROM moved
+            WHERE NOT COALESCE(is_read, FALSE)
+            GROUP BY receiver_id, sender_id
+        ),
+        counters AS (
+            UPDATE chat_conversations c
+            SET unread_count = GREATEST(c.unread_count - u.unread_count, 0)
+            FROM unread u
+            WHERE c.user_id = u.receiver_id AND c.other_user_id = u.sender_id
+        )
+        SELECT COUNT(*) FROM moved
+    $sql$;
+    partition_name TEXT;
+    batch INTEGER;
+    moved INTEGER := 0;
+    month_start DATE;
+BEGIN
+    -- Секции, целиком лежащие до границы, переносятся и удаляются без DELETE по строкам
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'chat_messages'::regclass
+            AND c.relname ~ '^chat_messages_\d{4}_\d{2}$'
+            AND to_date(substr(c.relname, 15), 'YYYY_MM') + INTERVAL '1 month' <= cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format(archive_sql, quote_ident(partition_name)) INTO batch;
+        EXECUTE format('DROP TABLE %I', partition_name);
+        moved := moved + batch;
+    END LOOP;
+
+    EXECUTE format(archive_sql, format('chat_messages_default WHERE created_at < %L', cutoff)) INTO batch;
+    DELETE FROM chat_messages_default WHERE created_at < cutoff;
+    moved := moved + batch;
+
+    month_start := date_trunc('month', CURRENT_TIMESTAMP);
+    WHILE month_start <= date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '2 months' LOOP
+        PERFORM create_chat_messages_partition(month_start);
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON TABLE chat_messages IS 'Сообщения чата между студентами и преподавателями (секции по месяцам)';
+COMMENT ON TABLE chat_messages_archive IS 'Архив сообщений чата старше срока хранения';
+COMMENT ON FUNCTION archive_chat_messages(INTERVAL) IS 'Перенос старых сообщений чата в архив';
@@ -0,0 +1,18 @@
+-- Повторное подтверждение одной загрузки не должно создавать второй материал с тем же файлом
+WITH duplicates AS (
+    SELECT id
+    FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY file_url ORDER BY id) AS n
+        FROM learning_materials
+        WHERE file_url LIKE 'https://cdn.poehali.dev/%'
+    ) numbered
+    WHERE n > 1
+),
+removed_statuses AS (
+    DELETE FROM material_status WHERE material_id IN (SELECT id FROM duplicates)
+)
+DELETE FROM learning_materials WHERE id IN (SELECT id FROM duplicates);
+
+-- Только ссылки на объекты хранилища: у текстовых материалов file_url пуст или повторяет содержание
+CREATE UNIQUE INDEX IF NOT EXISTS idx_materials_file_url ON learning_materials(file_url)
+    WHERE file_url LIKE 'https://cdn.poehali.dev/%';
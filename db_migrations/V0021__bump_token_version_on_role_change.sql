@@ -0,0 +1,14 @@
+-- Смена роли отзывает выданные токены независимо от того, каким запросом она сделана
+CREATE OR REPLACE FUNCTION bump_token_version_on_role_change() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.role IS DISTINCT FROM OLD.role THEN
+        NEW.token_version := OLD.token_version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_role_token_version ON users;
+CREATE TRIGGER trg_users_role_token_version
+    BEFORE UPDATE OF role ON users
+    FOR EACH ROW EXECUTE FUNCTION bump_token_version_on_role_change();
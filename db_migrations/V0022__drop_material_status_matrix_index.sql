@@ -0,0 +1,3 @@
+-- Ключ совпадает с уникальным ограничением (material_id, student_id), а матрица статусов
+-- читает teacher_comment, поэтому index-only scan по нему невозможен: индекс только замедляет запись
+DROP INDEX IF EXISTS idx_material_status_matrix;
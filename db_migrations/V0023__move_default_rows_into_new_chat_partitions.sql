@@ -0,0 +1,35 @@
+-- Новая секция не создаётся через PARTITION OF, если в секции по умолчанию уже лежат строки её месяца
+-- (например, после пропущенного запуска archive_chat_messages): такие строки переносятся в ту же транзакцию
+CREATE OR REPLACE FUNCTION create_chat_messages_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    partition_name TEXT := 'chat_messages_' || to_char(month_start, 'YYYY_MM');
+    range_start TIMESTAMP := date_trunc('month', month_start);
+    range_end TIMESTAMP := date_trunc('month', month_start) + INTERVAL '1 month';
+BEGIN
+    IF to_regclass(quote_ident(partition_name)) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE chat_messages INCLUDING DEFAULTS INCLUDING GENERATED, '
+        'CONSTRAINT %I CHECK (created_at >= %L AND created_at < %L))',
+        partition_name, partition_name || '_range', range_start, range_end
+    );
+
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM chat_messages_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+        'INSERT INTO %I (id, sender_id, receiver_id, message, is_read, created_at) '
+        'SELECT id, sender_id, receiver_id, message, is_read, created_at FROM moved',
+        range_start, range_end, partition_name
+    );
+
+    -- CHECK с теми же границами избавляет ATTACH от полного сканирования новой секции
+    EXECUTE format(
+        'ALTER TABLE chat_messages ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, range_start, range_end
+    );
+    EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', partition_name, partition_name || '_range');
+
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
@@ -16,6 +16,8 @@ interface Message {
   sender_name: string;
 }
 
+const LONG_POLL_SECONDS = 20;
+
 interface ChatDialogProps {
   open: boolean;
   onOpenChange: (open: boolean) => void;
@@ -35,7 +37,12 @@ export default function ChatDialog({
   const [newMessage, setNewMessage] = useState('');
   const [sending, setSending] = useState(false);
   const [loading, setLoading] = useState(true);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const lastIdRef = useRef<number | null>(null);
+  const firstIdRef = useRef<number | null>(null);
+  const sessionRef = useRef(0);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -43,23 +50,79 @@ export default function ChatDialog({
 
   useEffect(() => {
     if (open) {
-      loadMessages();
-      const interval = setInterval(loadMessages, 3000);
-      return () => clearInterval(interval);
+      const session = ++sessionRef.current;
+      lastIdRef.current = null;
+      firstIdRef.current = null;
+      setMessages([]);
+      setHasOlder(false);
+      setLoading(true);
+
+      const poll = async () => {
+        await loadMessages();
+        while (sessionRef.current === session) {
+          const ok = await loadMessages(LONG_POLL_SECONDS);
+          if (!ok) {
+            await new Promise(resolve => setTimeout(resolve, 3000));
+          }
+        }
+      };
+      poll();
+
+      return () => {
+        sessionRef.current++;
+      };
     }
   }, [open, otherUserId]);
 
+  const lastMessageId = messages.length > 0 ? messages[messages.length - 1].id : null;
+
   useEffect(() => {
     scrollToBottom();
-  }, [messages]);
+  }, [lastMessageId]);
+
+  const applyReadReceipts = (list: Message[], readUpToId: number | null) => {
+    if (!readUpToId) return list;
+    return list.map(msg =>
+      msg.sender_id === currentUserId && !msg.is_read && msg.id <= readUpToId
+        ? { ...msg, is_read: true }
+        : msg
+    );
+  };
+
+  const acknowledgeMessages = async (list: Message[]) => {
+    const token = localStorage.getItem('auth_token');
+    const unread = list.filter(msg => msg.sender_id === otherUserId && !msg.is_read);
+    if (!token || unread.length === 0) return;
+
+    try {
+      await fetch('https://functions.poehali.dev/b242cc50-04aa-458a-bebe-f0546a95bd31', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'X-Auth-Token': token
+        },
+        body: JSON.stringify({
+          action: 'ack',
+          other_user_id: otherUserId,
+          up_to_id: Math.max(...unread.map(msg => msg.id))
+        })
+      });
+    } catch (error) {
+      console.error('Ошибка отметки сообщений:', error);
+    }
+  };
 
-  const loadMessages = async () => {
+  const loadMessages = async (wait = 0): Promise<boolean> => {
     const token = localStorage.getItem('auth_token');
-    if (!token) return;
+    if (!token) return false;
 
+    const session = sessionRef.current;
     try {
+      const sinceId = lastIdRef.current;
+      const sinceParam = sinceId !== null ? `&since_id=${sinceId}` : '';
+      const waitParam = sinceId !== null && wait > 0 ? `&wait=${wait}` : '';
       const response = await fetch(
-        `https://functions.poehali.dev/b242cc50-04aa-458a-bebe-f0546a95bd31?other_user_id=${otherUserId}`,
+        `https://functions.poehali.dev/b242cc50-04aa-458a-bebe-f0546a95bd31?other_user_id=${otherUserId}${sinceParam}${waitParam}`,
         {
           method: 'GET',
           headers: {
@@ -70,16 +133,69 @@ export default function ChatDialog({
 
       const data = await response.json();
 
+      if (session !== sessionRef.current) return false;
+
       if (response.ok) {
-        setMessages(data.messages || []);
+        const incoming: Message[] = data.messages || [];
+        if (sinceId === null) {
+          lastIdRef.current = data.last_id ?? 0;
+          firstIdRef.current = data.first_id;
+          setHasOlder(Boolean(data.has_more));
+          setMessages(applyReadReceipts(incoming, data.read_up_to_id));
+        } else {
+          if (data.last_id) {
+            lastIdRef.current = data.last_id;
+          }
+          setMessages(prev => {
+            const known = new Set(prev.map(msg => msg.id));
+            const merged = prev.concat(incoming.filter(msg => !known.has(msg.id)));
+            return applyReadReceipts(merged, data.read_up_to_id);
+          });
+        }
+        acknowledgeMessages(incoming);
       }
+      return response.ok;
     } catch (error) {
       console.error('Ошибка загрузки сообщений:', error);
+      return false;
     } finally {
       setLoading(false);
     }
   };
 
+  const loadOlderMessages = async () => {
+    const token = localStorage.getItem('auth_token');
+    if (!token || firstIdRef.current === null) return;
+
+    setLoadingOlder(true);
+    try {
+      const response = await fetch(
+        `https://functions.poehali.dev/b242cc50-04aa-458a-bebe-f0546a95bd31?other_user_id=${otherUserId}&before_id=${firstIdRef.current}`,
+        {
+          method: 'GET',
+          headers: {
+            'X-Auth-Token': token
+          }
+        }
+      );
+
+      const data = await response.json();
+
+      if (response.ok) {
+        const older: Message[] = data.messages || [];
+        if (older.length > 0) {
+          firstIdRef.current = data.first_id;
+        }
+        setHasOlder(Boolean(data.has_more));
+        setMessages(prev => older.concat(prev));
+      }
+    } catch (error) {
+      console.error('Ошибка загрузки сообщений:', error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const handleSendMessage = async () => {
     if (!newMessage.trim()) return;
 
@@ -207,6 +323,19 @@ export default function ChatDialog({
             </div>
           ) : (
             <div className="space-y-6">
+              {hasOlder && (
+                <div className="flex justify-center">
+                  <Button
+                    variant="ghost"
+                    size="sm"
+                    onClick={loadOlderMessages}
+                    disabled={loadingOlder}
+                    className="text-xs text-muted-foreground"
+                  >
+                    {loadingOlder ? 'Загрузка...' : 'Показать более ранние сообщения'}
+                  </Button>
+                </div>
+              )}
               {Object.entries(messageGroups).map(([date, msgs]) => (
                 <div key={date}>
                   <div className="flex items-center justify-center mb-4">
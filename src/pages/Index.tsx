@@ -56,6 +56,7 @@ const Index = () => {
   const [loadingProgress, setLoadingProgress] = useState(false);
   const [materials, setMaterials] = useState<any[]>([]);
   const [loadingMaterials, setLoadingMaterials] = useState(false);
+  const [materialsCursor, setMaterialsCursor] = useState<string | null>(null);
   const [selectedMaterial, setSelectedMaterial] = useState<any>(null);
   const [showMaterialDialog, setShowMaterialDialog] = useState(false);
 
@@ -105,16 +106,8 @@ const Index = () => {
 
       if (response.ok && data.user) {
         const testResults = data.user.test_results || [];
-        const testsCompleted = testResults.length;
-        const averageScore =
-          testsCompleted > 0
-            ? Math.round(
-                testResults.reduce(
-                  (sum: number, test: any) => sum + test.score,
-                  0,
-                ) / testsCompleted,
-              )
-            : 0;
+        const testsCompleted = data.user.tests_completed ?? testResults.length;
+        const averageScore = Math.round(data.user.average_score ?? 0);
 
         setUserProgress({
           testsCompleted,
@@ -130,11 +123,12 @@ const Index = () => {
     }
   };
 
-  const loadMaterials = async (token: string) => {
-    setLoadingMaterials(true);
+  const loadMaterials = async (token: string, cursor: string | null = null) => {
+    setLoadingMaterials(cursor === null);
     try {
+      const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "";
       const response = await fetch(
-        "https://functions.poehali.dev/370b1dc6-d070-4917-b166-1422d71566fb",
+        `https://functions.poehali.dev/370b1dc6-d070-4917-b166-1422d71566fb?view=summary${cursorParam}`,
         {
           method: "GET",
           headers: {
@@ -146,7 +140,9 @@ const Index = () => {
       const data = await response.json();
 
       if (response.ok) {
-        setMaterials(data.materials || []);
+        const page = data.materials || [];
+        setMaterials((current) => (cursor ? current.concat(page) : page));
+        setMaterialsCursor(data.next_cursor || null);
       }
     } catch (error) {
       console.error("Ошибка загрузки материалов:", error);
@@ -155,6 +151,33 @@ const Index = () => {
     }
   };
 
+  const loadMaterialDetails = async (materialId: number) => {
+    const token = localStorage.getItem("auth_token");
+    if (!token) return;
+
+    try {
+      const response = await fetch(
+        `https://functions.poehali.dev/370b1dc6-d070-4917-b166-1422d71566fb?material_id=${materialId}`,
+        {
+          method: "GET",
+          headers: {
+            "X-Auth-Token": token,
+          },
+        },
+      );
+
+      const data = await response.json();
+
+      if (response.ok && data.material) {
+        setSelectedMaterial((current: any) =>
+          current && current.id === materialId ? data.material : current,
+        );
+      }
+    } catch (error) {
+      console.error("Ошибка загрузки материала:", error);
+    }
+  };
+
   const markLectureAsViewed = async (lecture: {
     title: string;
     duration: string;
@@ -2401,6 +2424,7 @@ P_max = I²R = 2² × 3 = 12 Вт
                         onClick={() => {
                           setSelectedMaterial(material);
                           setShowMaterialDialog(true);
+                          loadMaterialDetails(material.id);
                         }}
                       >
                         <div className="flex items-start gap-4">
@@ -2452,6 +2476,17 @@ P_max = I²R = 2² × 3 = 12 Вт
                         </div>
                       </div>
                     ))}
+                    {materialsCursor && (
+                      <Button
+                        variant="outline"
+                        onClick={() => {
+                          const token = localStorage.getItem("auth_token");
+                          if (token) loadMaterials(token, materialsCursor);
+                        }}
+                      >
+                        Показать ещё
+                      </Button>
+                    )}
                   </div>
                 )}
                 <div className="mt-8 pt-8 border-t border-border/50">
@@ -49,6 +49,7 @@ export default function TeacherDashboard() {
   const [addingStudent, setAddingStudent] = useState(false);
   
   const [materials, setMaterials] = useState<Material[]>([]);
+  const [materialsCursor, setMaterialsCursor] = useState<string | null>(null);
   const [showUploadDialog, setShowUploadDialog] = useState(false);
   const [uploadingFile, setUploadingFile] = useState(false);
   const [materialTitle, setMaterialTitle] = useState('');
@@ -184,12 +185,13 @@ export default function TeacherDashboard() {
     }
   };
 
-  const loadMaterials = async () => {
+  const loadMaterials = async (cursor: string | null = null) => {
     const token = localStorage.getItem('auth_token');
     if (!token) return;
 
     try {
-      const response = await fetch('https://functions.poehali.dev/370b1dc6-d070-4917-b166-1422d71566fb', {
+      const cursorParam = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const response = await fetch(`https://functions.poehali.dev/370b1dc6-d070-4917-b166-1422d71566fb${cursorParam}`, {
         method: 'GET',
         headers: {
           'X-Auth-Token': token
@@ -199,7 +201,9 @@ export default function TeacherDashboard() {
       const data = await response.json();
 
       if (response.ok) {
-        setMaterials(data.materials || []);
+        const page = data.materials || [];
+        setMaterials(current => (cursor ? current.concat(page) : page));
+        setMaterialsCursor(data.next_cursor || null);
       }
     } catch (error) {
       console.error('Ошибка загрузки материалов:', error);
@@ -1022,6 +1026,13 @@ export default function TeacherDashboard() {
                   ))}
                 </div>
               )}
+              {materialsCursor && (
+                <div className="flex justify-center mt-4">
+                  <Button variant="outline" onClick={() => loadMaterials(materialsCursor)}>
+                    Показать ещё
+                  </Button>
+                </div>
+              )}
               <div className="mt-8 pt-8 border-t border-border/50">
                 <img 
                   src="https://cdn.poehali.dev/projects/2340c444-1239-4e7b-b126-c7cce6b9f819/files/f9232f27-3ad6-4fe8-9aac-67f145452f83.jpg" 